@@ -35,6 +35,9 @@ for ch in (1,2):
 
 j.getphase()
 
+# or: get all of the above in one query
+j.get_wave_state()
+
 
 # changing status
 j.setfrequency(1,1000)
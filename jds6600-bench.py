@@ -0,0 +1,274 @@
+# jds6600-bench.py
+# benchmarks for the jds6600 library
+
+# published under MIT license. See file "LICENSE" for full license text
+
+# Two groups of benchmarks:
+#	link.*	round-trips per second and transfer times, measured against the
+#			real device (--port) or the simulator (default)
+#	cpu.*	CPU time spend in the library itself (encoding commands, parsing and
+#			decoding replies), measured with an in-memory port that returns
+#			prerecorded replies
+#
+# Results are printed and can be written as json (--output), and compared with
+# an earlier run (--compare).
+# Note: when run against a real device, channel 1 amplitude and the arbitrary
+# waveform slot used (--arbslot) are restored after the benchmark.
+
+import array
+import json
+import platform
+import statistics
+import sys
+import time
+
+import click
+
+from jds6600 import jds6600
+from jds6600sim import JDS6600Simulator
+
+
+# in-memory port: replies are computed once by the simulator and then
+# replayed, so only the time spend in the library is measured
+class _CannedPort:
+	is_open = True
+
+	def __init__(self):
+		self.timeout=1
+		self.__sim=JDS6600Simulator()
+		self.__replies={}
+		self.__rx=bytearray()
+	# end constructor
+
+	def write(self,data):
+		data=bytes(data)
+
+		try:
+			reply=self.__replies[data]
+		except KeyError:
+			reply=self.__replies[data]=self.__sim.command(data) or b''
+		# end try
+
+		self.__rx += reply
+		return len(data)
+	# end write
+
+	@property
+	def in_waiting(self):
+		return len(self.__rx)
+	# end in_waiting
+
+	def read(self,size=1):
+		data=bytes(self.__rx[:size])
+		del self.__rx[:size]
+		return data
+	# end read
+# end class _CannedPort
+
+
+# run "function" "n" times
+# returns (wall time per call, cpu time per call, list of wall time per call)
+def _measure(function,n):
+	times=[]
+
+	cpustart=time.process_time()
+	start=time.perf_counter()
+	for i in range(n):
+		t=time.perf_counter()
+		function(i)
+		times.append(time.perf_counter()-t)
+	# end for
+	wall=time.perf_counter()-start
+	cpu=time.process_time()-cpustart
+
+	return (wall/n,cpu/n,times)
+# end measure
+
+
+def _result(unit,value,times=None,**extra):
+	ret={"unit": unit, "value": value}
+
+	if times:
+		ret["median_s"]=statistics.median(times)
+		ret["max_s"]=max(times)
+	# end if
+
+	ret.update(extra)
+	return ret
+# end result
+
+
+# link benchmarks: round-trips and transfers
+def _bench_link(j,repeat,arbslot):
+	results={}
+
+	(wall,cpu,times)=_measure(lambda i: j.getamplitude(1),repeat)
+	results["link.read_single"]=_result("ops/s",1/wall,times)
+
+	(wall,cpu,times)=_measure(lambda i: j.get_wave_state(),repeat)
+	results["link.read_multi"]=_result("ops/s",1/wall,times,registers=12)
+
+	(wall,cpu,times)=_measure(lambda i: j.measure_getall(),repeat)
+	results["link.read_measure"]=_result("ops/s",1/wall,times,registers=6)
+
+	# writes: restore the amplitude of channel 1 afterwards
+	amplitude=j.getamplitude(1)
+	try:
+		(wall,cpu,times)=_measure(lambda i: j.setamplitude(1,amplitude),repeat)
+		results["link.write"]=_result("ops/s",1/wall,times)
+
+		# the time includes collecting the outstanding replies at the end of
+		# the block
+		start=time.perf_counter()
+		with j.pipeline():
+			for i in range(repeat):
+				j.setamplitude(1,amplitude)
+			# end for
+		# end with
+		wall=(time.perf_counter()-start)/repeat
+		results["link.write_pipelined"]=_result("ops/s",1/wall)
+	finally:
+		j.setamplitude(1,amplitude)
+	# end try
+
+	# arbitrary waveforms: restore the slot afterwards
+	arbrepeat=max(1,repeat//20)
+	wave=j.arb_getwave(arbslot)
+	try:
+		(wall,cpu,times)=_measure(lambda i: j.arb_getwave(arbslot),arbrepeat)
+		results["link.arb_getwave"]=_result("s",wall,times)
+
+		(wall,cpu,times)=_measure(lambda i: j.arb_setwave(arbslot,wave),arbrepeat)
+		results["link.arb_setwave"]=_result("s",wall,times)
+	finally:
+		j.arb_setwave(arbslot,wave)
+	# end try
+
+	return results
+# end bench link
+
+
+# cpu benchmarks: time spend in the library
+def _bench_cpu(repeat):
+	results={}
+	j=jds6600(_CannedPort())
+
+	for (name,function) in (
+			("cpu.read_single",lambda i: j.getamplitude(1)),
+			("cpu.read_multi",lambda i: j.get_wave_state()),
+			("cpu.snapshot",lambda i: j.snapshot()),
+			("cpu.write",lambda i: j.setamplitude(1,1.5)),
+			("cpu.setfrequency",lambda i: j.setfrequency(1,1000+i))):
+		(wall,cpu,times)=_measure(function,repeat*10)
+		results[name]=_result("us",cpu*1e6)
+	# end for
+
+	wave=[(i*2)%4096 for i in range(2048)]
+	arbrepeat=max(1,repeat//10)
+	(wall,cpu,times)=_measure(lambda i: j.arb_getwave(1),arbrepeat)
+	results["cpu.arb_getwave"]=_result("us",cpu*1e6)
+	(wall,cpu,times)=_measure(lambda i: j.arb_getwave(1,"array"),arbrepeat)
+	results["cpu.arb_getwave_array"]=_result("us",cpu*1e6)
+	(wall,cpu,times)=_measure(lambda i: j.arb_setwave(1,wave),arbrepeat)
+	results["cpu.arb_setwave"]=_result("us",cpu*1e6)
+	buffer=array.array('H',wave)
+	(wall,cpu,times)=_measure(lambda i: j.arb_setwave(1,buffer),arbrepeat)
+	results["cpu.arb_setwave_buffer"]=_result("us",cpu*1e6)
+
+	return results
+# end bench cpu
+
+
+# compare with an earlier run
+def _compare(results,old):
+	print()
+	print("{:24} {:>14} {:>14} {:>8}".format("benchmark","previous","now","change"))
+	for (name,r) in results.items():
+		if name not in old:
+			continue
+		# end if
+
+		o=old[name]["value"]
+		n=r["value"]
+		# for "ops/s" higher is better, for times lower is better
+		if r["unit"] == "ops/s":
+			change=(n-o)/o*100 if o else 0
+		else:
+			change=(o-n)/o*100 if o else 0
+		# end else - if
+
+		print("{:24} {:>14.6g} {:>14.6g} {:>+7.1f}%".format(name,o,n,change))
+	# end for
+	print("(change: positive is faster)")
+# end compare
+
+
+
+@click.command(help="Benchmark the jds6600 library against a device or the simulator")
+@click.option("--port", default=None, help="serial port of a real device (default: simulator)")
+@click.option("--latency", type=float, default=0.002, help="simulator: reply latency (s)")
+@click.option("--baudrate", type=int, default=115200, help="simulator: serial line speed")
+@click.option("--repeat", type=int, default=100, help="number of calls per benchmark")
+@click.option("--arbslot", type=int, default=60, help="arbitrary waveform slot used")
+@click.option("--link/--no-link", default=True, help="run the link benchmarks")
+@click.option("--cpu/--no-cpu", default=True, help="run the cpu benchmarks")
+@click.option("--output", type=click.Path(), default=None, help="write results as json")
+@click.option("--compare", type=click.Path(exists=True), default=None, help="compare with earlier json results")
+def main(port,latency,baudrate,repeat,arbslot,link,cpu,output,compare):
+	if repeat < 1:
+		raise click.BadParameter("repeat must be at least 1")
+	# end if
+
+	results={}
+	sim=None
+
+	if link == True:
+		if port == None:
+			sim=JDS6600Simulator(latency=latency,baudrate=baudrate)
+			port=sim.start()
+		# end if
+
+		try:
+			results.update(_bench_link(jds6600(port),repeat,arbslot))
+		finally:
+			if sim != None:
+				sim.stop()
+			# end if
+		# end try
+	# end if
+
+	if cpu == True:
+		results.update(_bench_cpu(repeat))
+	# end if
+
+	for (name,r) in results.items():
+		print("{:24} {:>14.6g} {}".format(name,r["value"],r["unit"]))
+	# end for
+
+	report={
+		"meta": {
+			"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"target": "simulator" if sim != None else port,
+			"latency": latency if sim != None else None,
+			"baudrate": baudrate if sim != None else None,
+			"repeat": repeat,
+			"python": platform.python_version(),
+			"machine": platform.machine()},
+		"results": results}
+
+	if output != None:
+		with open(output,"w") as f:
+			json.dump(report,f,indent=1)
+		# end with
+	# end if
+
+	if compare != None:
+		with open(compare) as f:
+			_compare(results,json.load(f)["results"])
+		# end with
+	# end if
+# end main
+
+
+if __name__ == '__main__':
+	main()
@@ -1,17 +1,102 @@
+import ast
+import json
+import os
+import socket
+import sys
+
+USB_PATH = os.environ.get("JDS6600_PORT", '/dev/ttyUSB0')
+
+# Unix socket of the daemon holding the serial port open (see "daemon" command)
+SOCKET_PATH = os.environ.get(
+    "JDS6600_SOCKET", "/tmp/jds6600-" + os.path.basename(USB_PATH) + ".sock")
+
+# time the daemon waits for the request of a client, in seconds
+CLIENT_TIMEOUT = 5
+
+
+########
+# Daemon client
+def daemon_request(request, timeout=60):
+    """Send a request to the daemon, return its reply or None if no daemon runs"""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+
+    # any socket error (no daemon, no permission, a daemon that does not
+    # answer) falls back to the serial port
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(CLIENT_TIMEOUT)
+            s.connect(SOCKET_PATH)
+            s.settimeout(timeout)
+            s.sendall(json.dumps(request).encode() + b"\n")
+            with s.makefile("rb") as f:
+                return json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+
+
+# Fast path: when the daemon runs, let it execute the command line. This is
+# done before importing click and the jds6600 library, so a command only costs
+# the Python startup and one request to the daemon.
+if __name__ == '__main__' and sys.argv[1:2] not in (["daemon"], ["run"]):
+    reply = daemon_request({"argv": sys.argv[1:]})
+    if reply is not None:
+        sys.stdout.write(reply["stdout"])
+        sys.stderr.write(reply["stderr"])
+        sys.exit(reply["status"])
+
+
+import builtins
+import contextlib
+import io
+import shlex
+
 import click
 
+import jds6600 as jds6600_module
 from jds6600 import jds6600 as JDS6600
 
-USB_PATH = '/dev/ttyUSB0'
+
+class DaemonProxy:
+    """Stand-in for a JDS6600 object, forwarding all calls to the daemon"""
+    def __getattr__(self, name):
+        def call(*args):
+            reply = daemon_request({"call": name, "args": repr(args)})
+            if reply is None:
+                raise RuntimeError("jds6600 daemon stopped")
+            if "error" in reply:
+                # raise the same exception as the library would
+                error = getattr(jds6600_module, reply["error"], None) or \
+                    getattr(builtins, reply["error"], None)
+                if not (isinstance(error, type) and issubclass(error, Exception)):
+                    error = RuntimeError
+                raise error(reply["message"])
+            return ast.literal_eval(reply["result"])
+        return call
+
 
 class JDS6600_Cli:
-    def __init__(self):
-        self.jds6600 = JDS6600(USB_PATH)
+    def __init__(self, direct=False):
+        # the device is opened when it is first used
+        self._jds6600 = None
+        self.direct = direct
+
+    @property
+    def jds6600(self):
+        if self._jds6600 is None:
+            if not self.direct and daemon_request({"ping": True}) is not None:
+                # the daemon has the serial port open
+                self._jds6600 = DaemonProxy()
+            else:
+                self._jds6600 = JDS6600(USB_PATH)
+        return self._jds6600
 
 @click.group()
 @click.pass_context
 def cli(ctx):
-    ctx.obj = JDS6600_Cli()
+    # the daemon passes its own object
+    if ctx.obj is None:
+        ctx.obj = JDS6600_Cli()
 
 
 #########################
@@ -349,6 +434,182 @@ def counter_stop(cli: JDS6600_Cli, mode):
     print("Done")
 
 
+########
+# Executing command lines
+def show_pipeline_errors(e):
+    # pipelined writes fail when their replies are collected, which can be
+    # during a later command: report the writes themselves
+    for (reg, val, reply) in e.errors:
+        print("Error: write of register {} (value {}) failed, reply: {!r}".format(
+            reg, val[:20], reply), file=sys.stderr)
+
+
+def execute(obj, argv):
+    """Execute one command line using obj, return the exit status"""
+    try:
+        ret = cli.main(args=argv, prog_name="jds6600-cli.py",
+                       standalone_mode=False, obj=obj)
+        return ret if isinstance(ret, int) else 0
+    except click.exceptions.Exit as e:
+        return e.exit_code
+    except click.ClickException as e:
+        e.show()
+        return e.exit_code
+    except click.exceptions.Abort:
+        print("Aborted!", file=sys.stderr)
+        return 1
+    except jds6600_module.PipelineError as e:
+        show_pipeline_errors(e)
+        return 1
+    except Exception as e:
+        print("Error: {}: {}".format(type(e).__name__, e), file=sys.stderr)
+        return 1
+
+
+@click.command("run", help="Run commands from a file (or stdin), one per line, over one connection")
+@click.argument("script", type=click.File("r"), default="-")
+@click.option("--stop-on-error/--continue-on-error", default=True,
+              help="Stop at the first command that fails (default) or continue")
+@click.option("--pipeline/--no-pipeline", default=True,
+              help="Send writes without waiting for the reply of the previous one")
+@click.pass_obj
+def run(cli: JDS6600_Cli, script, stop_on_error, pipeline):
+    # pipelined writes are not possible via the daemon
+    pipeline = pipeline and isinstance(cli.jds6600, JDS6600)
+    if pipeline:
+        cli.jds6600.pipeline_start()
+
+    failed = 0
+    for (lineno, line) in enumerate(script, 1):
+        # empty lines and comments
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+
+        try:
+            argv = shlex.split(line)
+        except ValueError as e:
+            argv = None
+            print("Error: line {}: {}".format(lineno, e), file=sys.stderr)
+
+        if argv and argv[0] in ("run", "daemon"):
+            argv = None
+            print("Error: line {}: \"{}\" not allowed in a script".format(lineno, line),
+                  file=sys.stderr)
+
+        status = 1 if argv is None else execute(cli, argv)
+        sys.stdout.flush()
+
+        if status != 0:
+            failed += 1
+            print("Error: line {} failed: {}".format(lineno, line), file=sys.stderr)
+            if stop_on_error:
+                break
+
+    if pipeline:
+        # collect the replies of the last writes
+        try:
+            cli.jds6600.pipeline_stop()
+        except jds6600_module.PipelineError as e:
+            show_pipeline_errors(e)
+            failed += 1
+
+    if failed:
+        raise click.exceptions.Exit(1)
+
+
+########
+# Daemon
+def daemon_handle(obj, request):
+    """Execute one request of a client"""
+    if "ping" in request:
+        return {"pong": True}
+
+    if "call" in request:
+        # call of a library function (DaemonProxy)
+        try:
+            if request["call"].startswith("_"):
+                raise ValueError("Unknown function: " + request["call"])
+            function = getattr(obj.jds6600, request["call"])
+            result = function(*ast.literal_eval(request["args"]))
+            return {"result": repr(result)}
+        except Exception as e:
+            return {"error": type(e).__name__, "message": str(e)}
+
+    # command line
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        status = execute(obj, request["argv"])
+    return {"stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "status": status}
+
+
+@click.command("daemon", help="Run a daemon holding the serial port open")
+@click.option("--background", is_flag=True, help="Run in the background")
+@click.option("--stop", is_flag=True, help="Stop a running daemon")
+def daemon(background, stop):
+    if stop:
+        if daemon_request({"stop": True}) is None:
+            print("No daemon running")
+        else:
+            print("Done")
+        return
+
+    if daemon_request({"ping": True}) is not None:
+        raise click.ClickException("Daemon already running on " + SOCKET_PATH)
+
+    # no daemon answers, so the socket is stale
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+
+    # open the port first, so errors are shown to the user
+    obj = JDS6600_Cli(direct=True)
+    obj.jds6600
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(SOCKET_PATH)
+    os.chmod(SOCKET_PATH, 0o600)
+    server.listen(16)
+
+    if background:
+        if os.fork() > 0:
+            print("Daemon started on " + SOCKET_PATH)
+            os._exit(0)
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+
+    try:
+        # one client at a time: this serialises the access to the device
+        while True:
+            conn, _ = server.accept()
+            # a client that does not send its request (or read the reply)
+            # must not block the daemon: drop it after a timeout
+            conn.settimeout(CLIENT_TIMEOUT)
+            stopping = False
+            try:
+                with conn, conn.makefile("rwb") as f:
+                    try:
+                        request = json.loads(f.readline())
+                    except ValueError:
+                        continue
+                    if "stop" in request:
+                        stopping = True
+                        f.write(b'{"stopped": true}\n')
+                    else:
+                        f.write(json.dumps(daemon_handle(obj, request)).encode() + b"\n")
+            except OSError:
+                pass
+            if stopping:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(SOCKET_PATH)
+
+
 # Add all subgroups to the main group
 cli.add_command(api_group)
 cli.add_command(info_group)
@@ -358,6 +619,8 @@ cli.add_command(mode_group)
 cli.add_command(common_group)
 cli.add_command(measure_group)
 cli.add_command(counter_group)
+cli.add_command(daemon)
+cli.add_command(run)
 
 
 if __name__ == '__main__':
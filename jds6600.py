@@ -15,6 +15,12 @@
 
 import serial
 import binascii
+import array
+import contextlib
+import collections
+import math
+import sys
+import time
 
 
 ###########
@@ -38,6 +44,125 @@ class WrongMode(RuntimeError):
 	# mode
 	pass
 
+class PipelineError(UnexpectedReplyError):
+	# called when one or more pipelined write commands did not get an ":ok"
+	# errors is a list of (register, value, reply) tuples, one per failed
+	# command, in the order the commands were send
+	def __init__(self,errors):
+		self.errors=errors
+		UnexpectedReplyError.__init__(self,errors)
+	# end constructor
+
+
+###########
+#  States #
+###########
+
+# "wave" mode state of one channel, see get_wave_state()
+#	enable: bool, waveform: (id, name), frequency: Hz (normalised),
+#	multiplier: frequency multiplier, amplitude: V, offset: V, dutycycle: %
+WaveChannelState=collections.namedtuple("WaveChannelState",("enable","waveform","frequency","multiplier","amplitude","offset","dutycycle"))
+
+# "wave" mode state of the device (registers 20 to 31)
+#	ch1, ch2: WaveChannelState, phase: degrees
+WaveState=collections.namedtuple("WaveState",("ch1","ch2","phase"))
+
+# settings of the other menus, see snapshot()
+MeasureState=collections.namedtuple("MeasureState",("coupling","gate","mode"))
+SweepState=collections.namedtuple("SweepState",("startfreq","endfreq","time","direction","mode"))
+PulseState=collections.namedtuple("PulseState",("pulsewidth","period","offset","amplitude"))
+BurstState=collections.namedtuple("BurstState",("number","mode"))
+SystemState=collections.namedtuple("SystemState",("sound","brightness","language","sync","arbmaxnum"))
+
+# data registers of the "measure" mode (registers 81 to 89)
+MeasureData=collections.namedtuple("MeasureData",("freq_f","freq_p","pw1","pw0","period","dutycycle","u1","u2","u3"))
+
+# a record of measure_stream(): time (as time.time()), values of the fields
+# asked for
+MeasureSample=collections.namedtuple("MeasureSample",("time","values"))
+
+# full device state, see snapshot()
+DeviceState=collections.namedtuple("DeviceState",("devicetype","serialnumber","wave","action","mode","measure","sweep","pulse","burst","system","counter","measuredata"))
+
+
+# convert a state (or any nested namedtuple) into dictionaries and lists,
+# e.g. to serialise it as json
+def state2dict(state):
+	if hasattr(state,"_asdict"):
+		return collections.OrderedDict((k,state2dict(v)) for (k,v) in state._asdict().items())
+	# end if
+
+	if type(state) in (tuple,list):
+		return [state2dict(v) for v in state]
+	# end if
+
+	return state
+# end state2dict
+
+
+
+#######################
+#  Arbitrary waveform #
+#######################
+
+# integer formats of the buffer protocol (see module "struct"), and the
+# array typecode to use by (signed, size of an item)
+_arbformats=("b","B","h","H","i","I","l","L","q","Q")
+_arbtypecodes={}
+for _typecode in _arbformats:
+	_arbtypecodes.setdefault((_typecode.islower(),array.array(_typecode).itemsize),_typecode)
+# end for
+
+# check the values of an arbitrary waveform, and return them as array('H')
+#	wave: 2048 integer values (0 - 4095), as a list or tuple, or as any
+#		object with the buffer protocol: array.array, numpy integer arrays,
+#		memoryviews, ...
+# Buffers are checked and converted as a whole, not value by value.
+def arb_samples(wave):
+	if (type(wave) == list) or (type(wave) == tuple):
+		if len(wave) != 2048: raise ValueError(wave)
+		if set(map(type,wave)) != {int}: raise ValueError(wave)
+		if not ((min(wave) >= 0) and (max(wave) <= 4095)): raise ValueError(wave)
+
+		return array.array('H',wave)
+	# end if
+
+	if hasattr(wave,"dtype") and hasattr(wave,"astype"):
+		# numpy array: checked by numpy (any byte order or stride)
+		if (wave.ndim != 1) or (wave.dtype.kind not in ("i","u")): raise ValueError(wave)
+		if len(wave) != 2048: raise ValueError(wave)
+		if not ((wave.min() >= 0) and (wave.max() <= 4095)): raise ValueError(wave)
+
+		samples=array.array('H')
+		samples.frombytes(wave.astype("=u2").tobytes())
+		return samples
+	# end if
+
+	try:
+		view=memoryview(wave)
+	except TypeError:
+		raise TypeError(wave)
+	# end try
+
+	order=view.format[:1] if view.format[:1] in ("@","=","<",">","!") else "@"
+	typecode=view.format.lstrip("@=<>!")
+
+	if (view.ndim != 1) or (typecode not in _arbformats): raise ValueError(wave)
+	if (typecode.islower(),view.itemsize) not in _arbtypecodes: raise ValueError(wave)
+	if len(view) != 2048: raise ValueError(wave)
+
+	# an array of the same size and signedness, in the byte order of the host
+	values=array.array(_arbtypecodes[(typecode.islower(),view.itemsize)])
+	values.frombytes(view.tobytes())
+	if order in ("<",">","!") and (order != ("<" if sys.byteorder == "little" else ">")):
+		values.byteswap()
+	# end if
+
+	if not ((min(values) >= 0) and (max(values) <= 4095)): raise ValueError(wave)
+
+	return values if values.typecode == 'H' else array.array('H',values)
+# end arb samples
+
 
 #################
 # jds6600 class #
@@ -46,7 +171,7 @@ class WrongMode(RuntimeError):
 class jds6600:
 	'jds6600 top-level class'
 
-	# serial device (opened during object init))
+	# serial device (opened during object init, one per object)
 	ser = None
 
 	# commands
@@ -113,6 +238,19 @@ class jds6600:
 	MEASURE_DATA_U2=88
 	MEASURE_DATA_U3=89
 
+	# data of the measure mode: name -> (register, unit), value = register / unit
+	# (names as in MeasureData)
+	MEASURE_DATA_SCALE=collections.OrderedDict((
+		("freq_f",(81,10)), # 0.1 Hz
+		("freq_p",(82,1000)), # 0.001 Hz
+		("pw1",(83,100)), # 0.01 us
+		("pw0",(84,100)), # 0.01 us
+		("period",(85,100)), # 0.01 us
+		("dutycycle",(86,10)), # 0.1 %
+		("u1",(87,1)),
+		("u2",(88,1)),
+		("u3",(89,1))))
+
 
 
 
@@ -166,13 +304,54 @@ class jds6600:
 	###############
 
 	def __init__(self,fname):
-			jds6600.ser = serial.Serial(
+		if type(fname) == str:
+			self.ser = serial.Serial(
 				port= fname,
 				baudrate=115200,
 				parity=serial.PARITY_NONE,
 				stopbits=serial.STOPBITS_ONE,
 				bytesize=serial.EIGHTBITS,
 				timeout=1		)
+		else:
+			# an already opened serial port, or an object that behaves like one
+			# (write, read, in_waiting, timeout and is_open)
+			self.ser = fname
+		# end else - if
+
+		# pipelined writes (see part 13)
+		# depth 0 means pipelining is disabled
+		self.__pipeline_depth=0
+		self.__pipeline_pending=[]
+
+		# register shadow (see part 15)
+		# None means the shadow is disabled
+		self.__shadow=None
+		self.__shadow_maxage=None
+
+		# write commands captured instead of send (see part 16)
+		# None means write commands are send to the device
+		self.__capture=None
+
+		# transmit buffer, reused for every command
+		self.__txbuf=bytearray()
+
+		# receive buffer: data received, up to position "rxpos" already used
+		self.__rxbuf=bytearray()
+		self.__rxpos=0
+		# set when replies of earlier commands can still be received
+		self.__rxstale=False
+
+		# timeouts (see part 17)
+		# None means the timeout is derived from the size of the reply
+		self.__timeout_fixed=None
+		self.__timeout_current=None
+		self.__timeout_start=None
+		# time to transfer one byte (start bit, 8 databits, stop bit)
+		self.__bytetime=10/getattr(self.ser,"baudrate",115200)
+		# learned latency of the link: average and mean deviation
+		# None means no reply has been measured yet
+		self.__latency=None
+		self.__latency_dev=None
 	# end constructor
 
 
@@ -184,54 +363,263 @@ class jds6600:
 	#####
 	# low-level support function
 
-	# parse data from read command
-	def __parsedata(self,reg,data,a):
-		if a not in (0,1): raise RuntimeError(a)
+	# receive a frame: one line of a reply, without the "\r\n"
+	# All data available on the serial port is read into the receive buffer at
+	# once, and frames are split off the buffer.
+	# returns None if no complete frame is received within the timeout
+	def __readframe(self):
+		buf=self.__rxbuf
+		deadline=time.perf_counter()+self.__timeout_current
+
+		while True:
+			i=buf.find(b'\n',self.__rxpos)
+			if i >= 0:
+				frame=buf[self.__rxpos:i-1 if buf[i-1:i] == b'\r' else i]
+				self.__rxused(i+1)
+				return frame
+			# end if
+
+			if not self.__receive(deadline):
+				return None
+			# end if
+		# end while
+	# end read frame
+
+
+	# read all data waiting on the serial port into the receive buffer, or
+	# wait for data (the serial port waits for the first byte, up to the
+	# timeout)
+	# returns False if no data is received before the deadline
+	def __receive(self,deadline):
+		if time.perf_counter() > deadline:
+			return False
+		# end if
+
+		n=self.ser.in_waiting
+		data=self.ser.read(n if n > 0 else 1)
+		if not data:
+			return False
+		# end if
+
+		self.__rxbuf += data
+		return True
+	# end receive
+
+
+	# the receive buffer is used up to position "pos"
+	def __rxused(self,pos):
+		self.__rxpos=pos
+
+		# all data used: empty the buffer, otherwise drop used data once in
+		# a while
+		if pos == len(self.__rxbuf):
+			self.__rxbuf.clear()
+			self.__rxpos=0
+		elif pos > 65536:
+			del self.__rxbuf[:pos]
+			self.__rxpos=0
+		# end elif - if
+	# end rx used
 
+
+	# decode values of an arbitrary waveform ("v1,v2,...") and add them to
+	# array "values"
+	def __decodearbvalues(self,values,data):
+		parts=data.split(b',')
+		n=len(values)
 		try:
-			(one,two)=data.split("=")
-		except ValueError:
-			raise FormatError("Parsing Returned data: Invalid format, missing \"=\"")
-	
-		two_b=two.split(".")
+			values.extend(map(jds6600.__arbdecode.__getitem__,parts))
+		except KeyError:
+			# not in the usual format (e.g. leading zeros)
+			del values[n:]
+
+			parts=[int(p) for p in parts]
+			if not ((min(parts) >= 0) and (max(parts) <= 4095)): raise ValueError(data)
+
+			values.extend(parts)
+		# end try
+	# end decode arbitrary waveform values
+
+
+	# receive the reply of an arbitrary waveform read (":bNN=v1,...,v2048,"),
+	# starting with "expect" (":bNN=")
+	# The values are decoded while the reply is being received.
+	# returns (values as array('H'), size of the reply in bytes), None if no
+	# reply within the timeout
+	def __readarbwave(self,expect,waveid):
+		buf=self.__rxbuf
+		deadline=time.perf_counter()+self.__timeout_current
+
+		values=array.array('H')
+		pos=None # position of the next value to decode, None = reply not found yet
+
+		while True:
+			if pos == None:
+				if buf.startswith(expect,self.__rxpos):
+					start=self.__rxpos
+					pos=start+len(expect)
+				elif buf.find(b'\n',self.__rxpos) >= 0:
+					# another (complete) frame first
+					frame=self.__readframe()
+					if not self.__stale(frame,'b',waveid,waveid+1):
+						errmsg="Parsing Return data: send/received reg mismatch: "+str(frame)+" / expected "+str(expect)
+						raise FormatError(errmsg)
+					# end if
+
+					continue
+				# end elif - if
+			# end if
+
+			if pos != None:
+				i=buf.find(b'\n',pos)
+				end=len(buf) if i < 0 else i
+
+				try:
+					# all complete values received up to now
+					last=buf.rfind(b',',pos,end)
+					if last >= pos:
+						self.__decodearbvalues(values,bytes(buf[pos:last]))
+						pos=last+1
+					# end if
+
+					if i >= 0:
+						# end of the reply: a last value without "," is accepted
+						rest=bytes(buf[pos:i].rstrip(b'\r'))
+						if rest:
+							self.__decodearbvalues(values,rest)
+						# end if
+
+						self.__rxused(i+1)
+						return (values,i+1-start)
+					# end if
+				except (ValueError,OverflowError):
+					raise UnexpectedValueError(bytes(buf[pos:end]))
+				# end try
+			# end if
+
+			if not self.__receive(deadline):
+				return None
+			# end if
+		# end while
+	# end read arbitrary waveform
+
+
+	# throw away all data received: replies of commands that timed out or
+	# failed, that can still arrive
+	def __discardrx(self):
+		self.__rxbuf.clear()
+		self.__rxpos=0
+
+		n=self.ser.in_waiting
+		if n > 0:
+			self.ser.read(n)
+		# end if
+
+		self.__rxstale=False
+	# end discard rx
+
+
+	# wait until the device stops sending (e.g. late replies of commands that
+	# timed out, still "tx" bytes of commands to receive), and throw away all
+	# data received
+	def __drainrx(self,tx):
+		deadline=time.perf_counter()+tx*self.__bytetime+jds6600.__timeout_margin_max
+
+		# the timeout of the serial port is the time the line must be quiet
+		self.__starttimeout(0,0,False)
+		while self.__receive(deadline):
+			pass
+		# end while
+
+		self.__discardrx()
+	# end drain rx
+
+
+	# check if a frame is a stale reply (of an earlier command) when waiting
+	# for the reply of reading registers "first" up to "last" (not included)
+	# with command "c" ("r" or "b")
+	# returns False for frames that are not a reply to any command
+	def __stale(self,frame,c,first,last):
+		if frame == b':ok':
+			return True
+		# end if
+
+		if (frame[:1] != b':') or (frame[1:2] not in (b'r',b'b')) or (frame[4:5] != b'=') or (not frame[2:4].isdigit()):
+			return False
+		# end if
+
+		# a reply of a register of this read that comes too early means the
+		# reply of the expected register is lost
+		return not ((frame[1:2] == c.encode()) and (first < int(frame[2:4]) < last))
+	# end stale
+
+
+	# parse the data of a reply frame of a read command
+	# ":rNN=value." or ":rNN=value,value." (register),
+	# ":bNN=value,...,value," (arbitrary waveform, 2048 values)
+	def __parsedata(self,frame,a):
+		data=frame[5:]
 
 		# reads from register are terminated by a "."
 		# reads of arbitrary waveform are not 
 		if a == 0:
-			if len(two_b) < 2:
-				raise FormatError("Parsing Returned data: Invalid format, missing \".\"")
+			if data[-1:] != b'.':
+				raise FormatError("Parsing Returned data: Invalid format, missing \".\": "+str(frame))
+			# end if
 
-			if len(two_b) > 2:
-				raise FormatError("Parsing Returned data: Invalid format, too many \".\"")
+			data=data[:-1]
 		# end if
 
-		# command to look for;
-		# "r" for register read, "b" for arbitrary waveform read
-		c = 'r' if a == 0 else 'b'
+		if b'.' in data:
+			raise FormatError("Parsing Returned data: Invalid format, too many \".\": "+str(frame))
+		# end if
 
-		# check if returned data matches reg that was send
-		if reg != None:
-			if one != ":"+c+reg:
-				errmsg="Parsing Return data: send/received reg mismatch: "+data+" / expected :"+c+reg
-				raise FormatError(errmsg)
-			# end if
+		values=data.split(b',')
+
+		# we should not receive empty datafields, except for after the last
+		# element of an arbitrary waveform
+		if (a == 1) and (len(values) == 2049) and (values[-1] == b''):
+			del values[-1]
 		# end if
 
-		# done: return data: part between "=" and ".", split on ","
-		return two_b[0].split(",")
+		try:
+			# a register with one value returns that value, otherwise a list
+			if len(values) == 1:
+				return int(values[0])
+			# end if
+
+			return [int(v) for v in values]
+		except ValueError:
+			raise UnexpectedValueError(values)
+		# end try
 	# end __parsedata
 
-	# command in textual form
-	def __reg2txt(self,reg):
-		return "0"+str(reg) if int(reg) < 10 else str(reg)
-	# end reg2txt
+	# start of the commands for registers 0 to 99, in bytes:
+	# ":rNN=" register read, ":wNN=" register write,
+	# ":bNN=" arbitrary waveform read, ":aNN=" arbitrary waveform write
+	__cmdprefix={c: tuple(b":%c%02d=" % (ord(c),reg) for reg in range(100)) for c in "rwba"}
+
+	# build command ":" + c + register + "=" + value (bytes) + ".\n" in the
+	# transmit buffer
+	def __encodecmd(self,c,reg,value):
+		buf=self.__txbuf
+
+		if 0 <= reg < 100:
+			buf[:]=jds6600.__cmdprefix[c][reg]
+		else:
+			buf[:]=b":%c%02d=" % (ord(c),reg)
+		# end else - if
+
+		buf += value
+		buf += b".\n"
+		return buf
+	# end encode command
 
 	# send read command (for n datapoint)
 	def __sendreadcmd(self,reg,n,a):
 		if type(n) != int: raise TypeError(n)
 		if a not in (0,1): raise ValueError(a)
 
-		regtxt=self.__reg2txt(reg)
 		if (n < 1):
 			raise ValueError(n)
 
@@ -248,8 +636,13 @@ class jds6600:
 		n -= 1
 
 		if self.ser.is_open == True:
-			tosend=":"+c+regtxt+"="+str(n)+"."+chr(0x0a)
-			self.ser.write(tosend.encode())
+			if self.__rxstale == True:
+				self.__discardrx()
+			# end if
+
+			tosend=self.__encodecmd(c,reg,b"%d" % n)
+			self.__starttimeout(len(tosend),jds6600.__replysize_arb if a == 1 else (n+1)*jds6600.__replysize_reg)
+			self.ser.write(tosend)
 	# end __sendreadcmd
 
 
@@ -259,48 +652,53 @@ class jds6600:
 		if type(n) != int: raise ValueError(n)
 		if a not in (0,1): raise ValueError(a) # a=0-> register read, a=1 -> arbitrary waveform read
 
+		# "r" for register read, "b" for arbitrary waveform read
+		c = 'r' if a == 0 else 'b'
+
 		ret=[] # return value
+		rxbytes=0
+
+		for expreg in range(reg,reg+n):
+			if expreg < 100:
+				expect=jds6600.__cmdprefix[c][expreg]
+			else:
+				expect=b":%c%02d=" % (ord(c),expreg)
+			# end else - if
 
-		c = int(reg) # counter
-		c_expect=self.__reg2txt(c)
-		for l in range(n):
-			# get one line responds from serial device
-			retserial=self.ser.readline()
-			# convert bytearray into string, then strip off terminating \n and \r
-			retserial=str(retserial,'utf-8').rstrip()
+			# get frames until the reply for the expected register, throwing
+			# away stale replies
+			while True:
+				frame=self.__readframe()
 
-			# get parsed data
-			# assume all data are single-value fields
-			parseddata=self.__parsedata(c_expect,retserial,a)
+				if frame == None:
+					self.__timedout()
+					self.__rxstale=True
+					raise FormatError("Parsing Returned data: no reply for register "+str(expreg))
+				# end if
 
-			# we receive a list of strings, all containing numeric (integer) values
+				if frame.startswith(expect):
+					break
+				# end if
 
-			if len(parseddata) == 1:
-			# if list with one value, return that value (converted to integer)
-				ret.append(int(parseddata[0]))
-			else:
-			# if list with multiple values, convert all strings to integers and return list
-				retlist=[]
-				retcount=0
-				for data in parseddata:
-					if data == "":
-						# we should not receive empty datafields, except for after the last element of an arbitrary waveform
-						if not ((a == 1) and (retcount == 2048)):
-							raise UnexpectedValueError(parseddata)
-					else:
-						retlist.append(int(data))
-					# end else - if
+				if not self.__stale(frame,c,expreg,reg+n):
+					self.__rxstale=True
+					errmsg="Parsing Return data: send/received reg mismatch: "+str(frame)+" / expected "+str(expect)
+					raise FormatError(errmsg)
+				# end if
+			# end while
 
-					retcount += 1
-				# end for
-				ret.append(retlist)
-			# end else - if
+			rxbytes += len(frame)+2
 
-			# increase next expected to-receive data
-			c += 1
-			c_expect=self.__reg2txt(c)
+			try:
+				ret.append(self.__parsedata(frame,a))
+			except:
+				self.__rxstale=True
+				raise
+			# end try
 		# end for
 
+		self.__endtimeout(rxbytes)
+
 		# return parsed data
 		# if only one element, return that element
 		# if multiple elements, return list
@@ -308,6 +706,32 @@ class jds6600:
 	# end __get responds and parse 1
 
 
+	# get the reply of a write command: the first frame that is not a (stale)
+	# reply of a read command
+	# returns the reply as a string, "" if no reply within the timeout
+	def __getwritereply(self):
+		while True:
+			frame=self.__readframe()
+
+			if frame == None:
+				self.__timedout()
+				self.__rxstale=True
+				return ""
+			# end if
+
+			if frame == b':ok':
+				self.__endtimeout(len(frame)+2)
+				return ":ok"
+			# end if
+
+			if (frame[:2] != b':r') and (frame[:2] != b':b'):
+				self.__rxstale=True
+				return str(frame,'utf-8','replace')
+			# end if
+		# end while
+	# end get write reply
+
+
 	# get data
 	def __getdata(self,reg, n=1, a=0):
 		if type(reg) != int: raise TypeError(reg)
@@ -317,38 +741,91 @@ class jds6600:
 		# a=0 -> register read
 		# a=1 -> arbitrary waveform read
 
+		# answer from the register shadow, if all registers are in there
+		if (self.__shadow != None) and (a == 0):
+			ret=self.__shadow_get(reg,n)
+			if ret != None:
+				return ret
+			# end if
+		# end if
+
+		# collect the "ok" of all pipelined writes first, as they come in
+		# before the reply of the read command
+		if self.__pipeline_pending:
+			self.pipeline_flush()
+		# end if
+
 		# send "read" commandline for "n" lines 
 		# copy "a" parameter from calling function
 		self.__sendreadcmd(reg,n,a)
 
-		return self.__getrespondsandparse(reg,n,a)
+		ret=self.__getrespondsandparse(reg,n,a)
+
+		if (self.__shadow != None) and (a == 0):
+			self.__shadow_put(reg,[ret] if n == 1 else ret)
+		# end if
+
+		return ret
 	# end __getdata 1
 
 	
 	# send write command and wait for "ok"
 	def __sendwritecmd(self,reg, val, a=0):
 		# note: a = "arbitrary waveform?": 0 = no (register write), 1 = yes (arb. waveform write)
-		# add a "0" to the command if it one single character
-		reg=self.__reg2txt(reg)
+		regnum=reg
 
-		# command to send: "w" for register write, "b" for arbitrary waveform write
+		# command to send: "w" for register write, "a" for arbitrary waveform write
 		cmd = "w" if a == 0 else "a"
 
+		# capture mode: only remember what would have been send
+		if self.__capture != None:
+			if type(val) == int: val = str(val)
+			if (type(val) != str) and (type(val) != bytes): raise TypeError(val)
+
+			self.__capture.append((regnum,val,a))
+			return
+		# end if
+
 		if self.ser.is_open == True:
 			if type(val) == int: val = str(val)
-			if type(val) != str: raise TypeError(val)
+			if (type(val) != str) and (type(val) != bytes): raise TypeError(val)
+
+			# replies of pipelined writes are not stale
+			if (self.__rxstale == True) and (not self.__pipeline_pending):
+				self.__discardrx()
+			# end if
+
+			tosend=self.__encodecmd(cmd,regnum,val if type(val) == bytes else val.encode())
+			self.__starttimeout(len(tosend),jds6600.__replysize_ok)
+			self.ser.write(tosend)
+
+			if (self.__shadow != None) and (a == 0):
+				self.__shadow_write(regnum,val)
+			# end if
+
+			# pipelined write: do not wait for the "ok" now, but remember the
+			# command so the "ok" can be matched to it later
+			if self.__pipeline_depth > 0:
+				self.__pipeline_pending.append((regnum,val,a,len(tosend)))
 
-			tosend=":"+cmd+reg+"="+val+"."+chr(0x0a)
-			self.ser.write(tosend.encode())
+				# do not let more then "depth" commands wait for an "ok"
+				if len(self.__pipeline_pending) >= self.__pipeline_depth:
+					self.pipeline_flush()
+				# end if
+
+				return
+			# end if
 
 			# wait for "ok"
 
-			# get one line responds from serial device
-			ret=self.ser.readline()
-			# convert bytearray into string, then strip off terminating \n and \r
-			ret=str(ret,'utf-8').rstrip()
+			ret=self.__getwritereply()
 
 			if ret != ":ok":
+				# the write has probably not been done
+				if (self.__shadow != None) and (a == 0):
+					self.shadow_invalidate(regnum)
+				# end if
+
 				raise UnexpectedReplyError(ret)
 			# end if
 
@@ -375,37 +852,217 @@ class jds6600:
 
 	# end set action
 
+
+	#####
+	# decode functions: convert register values into user units
+	# (shared by the individual getters and the multi-register reads)
+
+	# channel enable: (x,x) -> (bool,bool)
+	def __decode_channelenable(self,value):
+		(ch1,ch2)=value
+		try:
+			return (False,True)[ch1], (False,True)[ch2]
+		except IndexError:
+			errmsg="Unexpected value received: {},{}".format(ch1,ch2)
+			raise UnexpectedValueError(errmsg)
+	# end decode channel enable
+
+	# waveform: id -> (id, name)
+	def __decode_waveform(self,waveform):
+		# waveform 0 to 16 are in "wave" list, 101 to 160 are in __awave
+		try:
+			return (waveform,jds6600.__wave[waveform])
+		except IndexError:
+			pass
+
+		try:
+			return (waveform,jds6600.__awave[waveform-101])
+		except IndexError:
+			raise UnexpectedValueError(waveform)
+	# end decode waveform
+
+	# frequency: (f1,f2) -> Hz
+	def __decode_frequency(self,value):
+		(f1,f2)=value
+
+		# parse multiplier (value after ","): 0=Hz, 1=KHz,2=MHz, 3=mHz,4=uHz)
+		# note1: frequency unit is Hz / 100
+		# note2: multiplier 1 (khz) and 2 (mhz) only changes the visualisation on the
+		#							display of the jfs6600. The frequency itself is calculated in
+		#							the same way as for multiplier 0 (Hz)
+		#			mulitpliers 3 (mHZ) and 4 (uHz) do change the calculation of the frequency
+		try:
+			return(f1/100*self.__freqmultiply[f2])
+		except IndexError:
+			# unexptected value of frequency multiplier
+			raise UnexpectedValueError(f2)
+		# end elsif
+	# end decode frequency
+
+	# amplitude is mV -> so divide by 1000
+	def __decode_amplitude(self,amplitude):
+		return amplitude/1000
+	# end decode amplitude
+
+	# offset unit is 10 mV, and then add 1000
+	def __decode_offset(self,offset):
+		return (offset-1000)/100
+	# end decode offset
+
+	# dutycycle unit is 0.1 %, so divide by 10
+	def __decode_dutycycle(self,dutycycle):
+		return dutycycle/10
+	# end decode dutycycle
+
+	# phase unit is 0.1 degrees, so divide by 10
+	def __decode_phase(self,phase):
+		return phase/10
+	# end decode phase
+
+	# (id) -> (id, name), for all parameters that are selected from a list
+	def __decode_list(self,value,valuelist):
+		try:
+			return (value,valuelist[value])
+		except (IndexError,TypeError):
+			raise UnexpectedValueError(value)
+		# end try
+	# end decode list
+
+	# mode: register 33 -> (modeid, modetxt)
+	def __decode_mode(self,mode):
+		# mode is in the list "modes". mode-name "" means undefinded
+		mode=int(mode)>>3
+
+		try:
+			(modeid,modetxt)=jds6600.__modes[mode]
+		except IndexError:
+			raise UnexpectedValueError(mode)
+
+		# modeid 3 is not valid and returns an id of -1
+		if modeid >= 0:
+			return modeid,modetxt
+		# end if
+
+
+		# modeid 4
+		raise UnexpectedValueError(mode)
+	# end decode mode
+
+	# action: register 32 -> action name, None if not a known action
+	def __decode_action(self,action):
+		actioncode=",".join(str(a) for a in action)
+
+		for (actionname,code) in jds6600.__actionlist:
+			if code == actioncode:
+				return actionname
+			# end if
+		# end for
+
+		return None
+	# end decode action
+
+	# pulse pulsewidth or period: (time,multiplier) -> s
+	def __decode_pulsetime(self,value):
+		time,multi = value
+
+		if multi==0: return time / 1000000000 # ns
+		elif multi == 1: return time / 1000000 # us
+		else:
+			raise UnexpectedValueError(multi)
+		# end else - elsif - if
+	# end decode pulsetime
+
+	# system sync: 5 fields (x,x,x,x,x) -> list of bool
+	def __decode_sync(self,sync):
+		# returns a list of 5 fields: frequency, wave, amplitude, dutycycle and offset
+		if len(sync) != 5:
+			raise UnexpectedValueError(sync)
+		# end if
+
+		# return data
+		ret=[]
+		for s in sync:
+			if s not in (0,1): raise UnexpectedValueError(sync)
+
+			ret.append((False,True)[s])
+		# end for
+
+		return ret
+	# end decode sync
+
+	# wave state: registers 20 to 31 -> WaveState
+	def __decode_wavestate(self,data):
+		enable=self.__decode_channelenable(data[0])
+
+		channels=[]
+		for ch in (0,1):
+			# per-channel registers are interleaved: ch1, ch2
+			freq=data[jds6600.FREQUENCY1-jds6600.CHANNELENABLE+ch]
+
+			channels.append(WaveChannelState(
+				enable[ch],
+				self.__decode_waveform(data[jds6600.WAVEFORM1-jds6600.CHANNELENABLE+ch]),
+				self.__decode_frequency(freq),
+				freq[1],
+				self.__decode_amplitude(data[jds6600.AMPLITUDE1-jds6600.CHANNELENABLE+ch]),
+				self.__decode_offset(data[jds6600.OFFSET1-jds6600.CHANNELENABLE+ch]),
+				self.__decode_dutycycle(data[jds6600.DUTYCYCLE1-jds6600.CHANNELENABLE+ch])))
+		# end for
+
+		return WaveState(channels[0],channels[1],self.__decode_phase(data[jds6600.PHASE-jds6600.CHANNELENABLE]))
+	# end decode wave state
+
 	###################
 	# DEBUG functions #
 	###################
 
 	def DEBUG_readregister(self,register,count):
+		if self.__pipeline_pending:
+			self.pipeline_flush()
+		# end if
+
 		if self.ser.is_open == True:
-			regtxt=self.__reg2txt(register)
-			tosend=":r"+regtxt+"="+str(count)+"."+chr(0x0a)
-			self.ser.write(tosend.encode())
-
-			ret=self.ser.readline()
-			while ret != b'':
-				print(str(ret))
-				ret=self.ser.readline()
+			tosend=self.__encodecmd("r",register,str(count).encode())
+			self.__starttimeout(len(tosend),(count+1)*jds6600.__replysize_reg)
+			self.ser.write(tosend)
+
+			ret=self.__readframe()
+			while ret != None:
+				print(str(bytes(ret)))
+				ret=self.__readframe()
 			# end while 
 		# end if
 	# end readregister
 		
 	def DEBUG_writeregister(self,register,value):
+		if self.__pipeline_pending:
+			self.pipeline_flush()
+		# end if
+
 		if self.ser.is_open == True:
-			regtxt=self.__reg2txt(register)
 			if type(value) == int:
 				value=str(value)
 
-			tosend=":w"+regtxt+"="+value+"."+chr(0x0a)
-			self.ser.write(tosend.encode())
+			tosend=self.__encodecmd("w",register,value.encode())
+			self.__starttimeout(len(tosend),jds6600.__replysize_ok)
+			self.ser.write(tosend)
+
+			# the shadow does not know what was written: forget the register
+			if register == jds6600.PROFILE_LOAD:
+				self.shadow_invalidate()
+			else:
+				self.shadow_invalidate(register)
+
+				# system parameters are read from the next register (see part 11)
+				if jds6600.SYSTEM_SOUND <= register <= jds6600.SYSTEM_ARBMAXNUM:
+					self.shadow_invalidate(register+1)
+				# end if
+			# end else - if
 
-			ret=self.ser.readline()
-			while ret != b'':
-				print(str(ret))
-				ret=self.ser.readline()
+			ret=self.__readframe()
+			while ret != None:
+				print(str(bytes(ret)))
+				ret=self.__readframe()
 			# end while 
 		# end if
 
@@ -485,12 +1142,7 @@ class jds6600:
 
 	# get channel enable status
 	def getchannelenable(self):
-		(ch1,ch2)=self.__getdata(jds6600.CHANNELENABLE)
-		try:
-			return (False,True)[ch1], (False,True)[ch2]
-		except IndexError:
-			errmsg="Unexpected value received: {},{}".format(ch1,ch2)
-			raise UnexpectedValueError(errmsg)
+		return self.__decode_channelenable(self.__getdata(jds6600.CHANNELENABLE))
 	# end get channel enable status
 
 	# get waveform
@@ -501,16 +1153,7 @@ class jds6600:
 		#WAVEFORM for channel 2 is WAVEFORM1 + 1
 		waveform=self.__getdata(jds6600.WAVEFORM1+channel-1)
 
-		# waveform 0 to 16 are in "wave" list, 101 to 160 are in __awave
-		try:
-			return (waveform,jds6600.__wave[waveform])
-		except IndexError:
-			pass
-
-		try:
-			return (waveform,jds6600.__awave[waveform-101])
-		except IndexError:
-			raise UnexpectedValueError(waveform)
+		return self.__decode_waveform(waveform)
 	# end getwaveform
 
 	# get frequency _with multiplier
@@ -536,20 +1179,7 @@ class jds6600:
 		if type(channel) != int: raise TypeError(channel)
 		if not (channel in (1,2)): raise ValueError(channel)
 
-		(f1,f2)=self.__getdata(jds6600.FREQUENCY1+channel-1)
-
-		# parse multiplier (value after ","): 0=Hz, 1=KHz,2=MHz, 3=mHz,4=uHz)
-		# note1: frequency unit is Hz / 100
-		# note2: multiplier 1 (khz) and 2 (mhz) only changes the visualisation on the
-		#							display of the jfs6600. The frequency itself is calculated in
-		#							the same way as for multiplier 0 (Hz)
-		#			mulitpliers 3 (mHZ) and 4 (uHz) do change the calculation of the frequency
-		try:
-			return(f1/100*self.__freqmultiply[f2])
-		except IndexError:
-			# unexptected value of frequency multiplier
-			raise UnexpectedValueError(f2)
-		# end elsif
+		return self.__decode_frequency(self.__getdata(jds6600.FREQUENCY1+channel-1))
 	# end function getfreq
 
 
@@ -560,8 +1190,7 @@ class jds6600:
 
 		amplitude=self.__getdata(jds6600.AMPLITUDE1+channel-1)
 
-		# amplitude is mV -> so divide by 1000
-		return amplitude/1000
+		return self.__decode_amplitude(amplitude)
 	# end getamplitude
 	
 	
@@ -572,8 +1201,7 @@ class jds6600:
 
 		offset=self.__getdata(jds6600.OFFSET1+channel-1)
 
-		# offset unit is 10 mV, and then add 1000
-		return (offset-1000)/100
+		return self.__decode_offset(offset)
 	# end getoffset
 
 	# get dutcycle
@@ -583,8 +1211,7 @@ class jds6600:
 
 		dutycycle=self.__getdata(jds6600.DUTYCYCLE1+channel-1)
 
-		# dutycycle unit is 0.1 %, so divide by 10
-		return dutycycle/10
+		return self.__decode_dutycycle(dutycycle)
 	# end getdutycycle
 
 	
@@ -592,10 +1219,18 @@ class jds6600:
 	def getphase(self):
 		phase=self.__getdata(jds6600.PHASE)
 
-		# phase unit is 0.1 degrees, so divide by 10
-		return phase/10
+		return self.__decode_phase(phase)
 	# end getphase
 
+
+	# get all "wave" mode parameters of both channels in one query
+	def get_wave_state(self):
+		# registers 20 (channel enable) up to 31 (phase)
+		data=self.__getdata(jds6600.CHANNELENABLE,jds6600.PHASE-jds6600.CHANNELENABLE+1)
+
+		return self.__decode_wavestate(data)
+	# end get wave state
+
 	
 	##################################
 	# Part 3: writing basic parameters
@@ -831,24 +1466,7 @@ class jds6600:
 	def getmode(self):
 		mode=self.__getdata(jds6600.MODE)
 
-
-		# mode is in the list "modes". mode-name "" means undefinded
-		mode=int(mode)>>3
-
-		try:
-			(modeid,modetxt)=jds6600.__modes[mode]
-		except IndexError:
-			raise UnexpectedValueError(mode)
-
-		# modeid 3 is not valid and returns an id of -1
-		if modeid >= 0:
-			return modeid,modetxt
-		# end if
-
-
-		# modeid 4
-		raise UnexpectedValueError(mode)
-
+		return self.__decode_mode(mode)
 	# end getmode
 
 
@@ -923,11 +1541,7 @@ class jds6600:
 	def measure_getcoupling(self):
 		coupling=self.__getdata(jds6600.MEASURE_COUP)
 
-		try:
-			return (coupling,jds6600.__measure_coupling[coupling])
-		except IndexError:
-			raise UnexpectedValueError(coupling)
-		# end try
+		return self.__decode_list(coupling,jds6600.__measure_coupling)
 	# end get coupling (measure mode)
 
 	# get gate time (measure mode)
@@ -945,11 +1559,7 @@ class jds6600:
 	def measure_getmode(self):
 		mode=self.__getdata(jds6600.MEASURE_MODE)
 
-		try:
-			return (mode,jds6600.__measure_mode[mode])
-		except IndexError:
-			raise UnexpectedValueError(mode)
-		# end try
+		return self.__decode_list(mode,jds6600.__measure_mode)
 	# end get mode (measure)
 
 
@@ -1110,15 +1720,111 @@ class jds6600:
 	# end get freq-Lowres (measure)
 
 
-	# get Measure all (all usefull data: freq_f, freq_p, pw1, pw0, period, dutycycle
-	def measure_getall(self):
+	# get Measure all (all usefull data: freq_f, freq_p, pw1, pw0, period, dutycycle
+	def measure_getall(self):
+
+		# do query for 6 values (start with freq_q)
+		(freq_f, freq_p, pw1, pw0, period, dutycycle)=self.__getdata(jds6600.MEASURE_DATA_FREQ_LOWRES,6)
+
+		# return all
+		return (freq_f / 10, freq_p / 1000, pw1/100, pw0/100, period/100, dutycycle/10)
+	# end get freq-Lowres (measure)
+
+
+	# stream measured data: a generator of MeasureSample records, one per new
+	# gate result
+	#	fields: names of the data to read (see MEASURE_DATA_SCALE), all data
+	#		registers needed are read in one query
+	#	interval: time between two queries in seconds, default half the gate
+	#		time (read once, at the start)
+	#	maxinterval: a result equal to the previous one is not returned (it
+	#		is the same gate result), unless "maxinterval" seconds have passed
+	#		since the last record (then it is a new, equal, gate result),
+	#		default the gate time. Counted between the planned times of the
+	#		queries, with a margin of half an interval
+	#	count: number of records, None = no limit
+	#	raw: return the register values instead of scaled values
+	# The device is only queried when the consumer asks for the next record:
+	# when the consumer is slower then the gate time, results are skipped (not
+	# queued) and the queries are not done faster to catch up.
+	def measure_stream(self,fields=("freq_f","freq_p","pw1","pw0","period","dutycycle"),interval=None,maxinterval=None,count=None,raw=False):
+		if (type(fields) != list) and (type(fields) != tuple): raise TypeError(fields)
+		if (interval != None) and (type(interval) != int) and (type(interval) != float): raise TypeError(interval)
+		if (maxinterval != None) and (type(maxinterval) != int) and (type(maxinterval) != float): raise TypeError(maxinterval)
+		if (count != None) and (type(count) != int): raise TypeError(count)
+		if type(raw) != bool: raise TypeError(raw)
+
+		if not fields: raise ValueError(fields)
+		for field in fields:
+			if field not in jds6600.MEASURE_DATA_SCALE:
+				errmsg="Unknown measure data: "+str(field)
+				raise ValueError(errmsg)
+			# end if
+		# end for
+
+		if (interval != None) and not (interval > 0): raise ValueError(interval)
+		if (count != None) and (count < 0): raise ValueError(count)
+
+		return self.__measure_stream(fields,interval,maxinterval,count,raw)
+	# end measure stream
+
+
+	# (generator of measure_stream, so the parameters are checked at the call)
+	def __measure_stream(self,fields,interval,maxinterval,count,raw):
+		# one query for all registers needed: the registers in between cost
+		# less then an extra query
+		regs=[jds6600.MEASURE_DATA_SCALE[f][0] for f in fields]
+		first=min(regs)
+		n=max(regs)-first+1
+		index=[r-first for r in regs]
+		units=[jds6600.MEASURE_DATA_SCALE[f][1] for f in fields]
+
+		if (interval == None) or (maxinterval == None):
+			gate=self.measure_getgate()
+			if interval == None: interval=gate/2
+			if maxinterval == None: maxinterval=gate
+		# end if
+
+		last=None
+		lastdue=None
+		done=0
+		due=time.perf_counter()
+
+		while (count == None) or (done < count):
+			wait=due-time.perf_counter()
+			if wait > 0:
+				time.sleep(wait)
+			# end if
+
+			now=time.perf_counter()
+			data=self.__getdata(first,n)
+			if n == 1: data=[data]
+			values=tuple(data[i] for i in index)
+
+			# the age of the last record is taken from the times the queries
+			# were planned, not when they were done: the jitter of sleep()
+			# would drop equal results of the next gate period
+			querydue=due
 
-		# do query for 6 values (start with freq_q)
-		(freq_f, freq_p, pw1, pw0, period, dutycycle)=self.__getdata(jds6600.MEASURE_DATA_FREQ_LOWRES,6)
+			# next query: one interval later, but not earlier then now (no
+			# catching up after a slow consumer)
+			due=max(due+interval,now)
 
-		# return all
-		return (freq_f / 10, freq_p / 1000, pw1/100, pw0/100, period/100, dutycycle/10)
-	# end get freq-Lowres (measure)
+			if (values == last) and (querydue-lastdue < maxinterval-interval/2):
+				continue
+			# end if
+
+			last=values
+			lastdue=querydue
+			done += 1
+
+			if raw == False:
+				values=tuple(v/u for (v,u) in zip(values,units))
+			# end if
+
+			yield MeasureSample(time.time(),values)
+		# end while
+	# end measure stream
 
 
 
@@ -1195,22 +1901,14 @@ class jds6600:
 	def sweep_getdirection(self):
 		direction=self.__getdata(jds6600.SWEEP_DIRECTION)
 
-		try:
-			return (direction,jds6600.__sweep_direction[direction])
-		except IndexError:
-			raise UnexpectedValueError(direction)
-		# end try
+		return self.__decode_list(direction,jds6600.__sweep_direction)
 	# end get direction (sweep)
 
 	# get sweep mode
 	def sweep_getmode(self):
 		mode=self.__getdata(jds6600.SWEEP_MODE)
 
-		try:
-			return (mode,jds6600.__sweep_mode[mode])
-		except IndexError:
-			raise UnexpectedValueError(mode)
-		# end try
+		return self.__decode_list(mode,jds6600.__sweep_mode)
 	# end get mode (measure)
 
 	def sweep_setstartfreq(self, frequency):
@@ -1391,13 +2089,7 @@ class jds6600:
 	# get pulsewidth, normalised to s
 	def pulse_getpulsewidth(self):
 		# pulsewith returns two datafiels, periode + multiplier
-		time,multi = self.__getdata(jds6600.PULSE_PULSEWIDTH)
-
-		if multi==0: return time / 1000000000 # ns
-		elif multi == 1: return time / 1000000 # us
-		else:
-			UnexptectedValue(multi)
-		# end else - elsif - if
+		return self.__decode_pulsetime(self.__getdata(jds6600.PULSE_PULSEWIDTH))
 	# end 
 
 	# get pulsewidth, not normalised
@@ -1410,13 +2102,7 @@ class jds6600:
 	# get period, normalised to s
 	def pulse_getperiod(self):
 		# period returns two datafiels, periode + multiplier
-		time,multi = self.__getdata(jds6600.PULSE_PERIOD)
-
-		if multi==0: return time / 1000000000 # ns
-		elif multi == 1: return time / 1000000 # us
-		else:
-			UnexptectedValue(multi)
-		# end else - elsif - if
+		return self.__decode_pulsetime(self.__getdata(jds6600.PULSE_PERIOD))
 	# end 
 
 
@@ -1565,12 +2251,7 @@ class jds6600:
 	def burst_getmode(self):
 		mode = self.__getdata(jds6600.BURST_MODE)
 
-		try:
-			return(mode,jds6600.__burst_mode[mode])
-		except IndexError:
-			raise UnexpectedValue(mode)
-			
-		# end try
+		return self.__decode_list(mode,jds6600.__burst_mode)
 	# end burst get mode
 
 
@@ -1692,10 +2373,7 @@ class jds6600:
 		else: TypeError(bugfix)
 
 		# we should receive a 0 or a 1
-		try:
-			return language,jds6600.__system_language[language]
-		except KeyError:
-			raise UnexpectedValueError(sound)
+		return self.__decode_list(language,jds6600.__system_language)
 	#end system_getlanguage
 
 	def system_getsync(self, bugfix=True):
@@ -1706,20 +2384,7 @@ class jds6600:
 		else: TypeError(bugfix)
 
 		# returns a list of 5 fields: frequency, wave, amplitude, dutycycle and offset
-		if len(sync) != 5:
-			raise UnexpectedValueError(sync)
-		# end if
-
-		# return data
-		ret=[]
-		for s in sync:
-			if s not in (0,1): raise UnexpectedValueError(sync)
-
-			ret.append((False,True)[s])
-		# end for
-
-		# return  data
-		return ret
+		return self.__decode_sync(sync)
 	# end system_getsync
 
 
@@ -1854,40 +2519,743 @@ class jds6600:
 	#######################
 	# Part 12: Arbitrary waveform operations
 
-	def arb_getwave(self,waveid):
+	# result: "list" (list of int), "array" (array.array('H')) or "numpy"
+	# (numpy uint16 array)
+	def arb_getwave(self,waveid,result="list"):
 		if type(waveid) != int: raise TypeError(waveid)
 
 		# waveid is between 1 and 60
 		if not(1 <= waveid <= 60): raise ValueError(waveid)
 
-		# getdata, reg=waveform id, data = 1, a=1 (register/waveform selector)
-		return self.__getdata(waveid,1,a=1)
+		if result not in ("list","array","numpy"): raise ValueError(result)
+
+		values=self.__getarbwave(waveid)
+
+		if result == "array":
+			return values
+		elif result == "numpy":
+			import numpy
+			return numpy.frombuffer(values,dtype=numpy.uint16)
+		# end elif - if
+
+		return values.tolist()
 	# end get arbtrary waveform
 
 
+	# read an arbitrary waveform, returns array('H')
+	def __getarbwave(self,waveid):
+		if self.__pipeline_pending:
+			self.pipeline_flush()
+		# end if
+
+		# send read command, reg=waveform id, data = 1, a=1 (register/waveform selector)
+		self.__sendreadcmd(waveid,1,1)
+
+		try:
+			reply=self.__readarbwave(jds6600.__cmdprefix['b'][waveid],waveid)
+		except:
+			self.__rxstale=True
+			raise
+		# end try
+
+		if reply == None:
+			self.__timedout()
+			self.__rxstale=True
+			raise FormatError("Parsing Returned data: no reply for arbitrary waveform "+str(waveid))
+		# end if
+
+		(values,rxbytes)=reply
+
+		if len(values) != 2048:
+			self.__rxstale=True
+			raise UnexpectedValueError(values)
+		# end if
+
+		self.__endtimeout(rxbytes)
+		return values
+	# end get arbitrary waveform
+
+
+	# values of an arbitrary waveform (0 to 4095) in textual form, in bytes
+	__arbvalues=tuple(b"%d" % val for val in range(4096))
+
+	# and the other way around
+	__arbdecode={val: i for (i,val) in enumerate(__arbvalues)}
+
 	def arb_setwave(self,waveid,wave):
 		if type(waveid) != int: raise TypeError(waveid)
-		if (type(wave) != tuple) and (type(wave) != list): raise TypeError(wave)
-		
+
 		# waveid is between 1 and 60
 		if not(1 <= waveid <= 60): raise ValueError(waveid)
 
-		# wave should be a list or tuple of 2048 elements, all integers, with a value between 0 and 4095
-		if len(wave) != 2048: raise ValueError(wave)
-
-		tosend=""
-		for val in wave:
-			if type(val) != int: raise ValueError(wave)
-			if not (0 <= val <= 4095): raise ValueError(wave)
+		# wave should have 2048 elements, all integers, with a value between 0 and 4095
+		values=arb_samples(wave)
 
-			tosend += (str(val) if tosend=="" else ","+str(val))
-		# end for
+		tosend=b",".join(map(jds6600.__arbvalues.__getitem__,values))
 			
 		# write waveform, reg=waveform id, data = waveform, a=1 (register/waveform selector)
 		self.__sendwritecmd(waveid,tosend,a=1)
 
 	# end set arbirtary waveform
 
+
+	#######################
+	# Part 13: pipelined writes
+
+	# In pipelined mode, write commands are send without waiting for the ":ok"
+	# of the previous command. The replies are collected later (when "depth"
+	# commands are waiting, before the next read or on pipeline_flush()) and
+	# matched to the commands in the order they were send.
+
+	# start pipelined write mode
+	def pipeline_start(self,depth=16):
+		if type(depth) != int: raise TypeError(depth)
+
+		# depth is the maximum number of commands waiting for an ":ok"
+		if not (1 <= depth <= 256):
+			raise ValueError(depth)
+		# end if
+
+		self.__pipeline_depth=depth
+	# end pipeline start
+
+
+	# collect the replies of all write commands waiting for an ":ok"
+	def pipeline_flush(self):
+		pending=self.__pipeline_pending
+		self.__pipeline_pending=[]
+
+		# read all replies, also after an error, so that the serial line
+		# stays in sync with the commands
+		errors=[]
+		timedout=False
+		tx=0
+		for (reg,val,a,size) in pending:
+			# the device handles the commands one by one: wait for every
+			# reply as for a single write, plus the transfer time of the
+			# earlier commands that have not been answered yet
+			# (replies can already be waiting: no latency measurement)
+			tx += size
+			self.__starttimeout(tx,jds6600.__replysize_ok,False)
+			ret=self.__getwritereply()
+
+			if ret == ":ok":
+				tx=0
+			else:
+				errors.append((reg,val,ret))
+
+				if ret == "":
+					timedout=True
+				# end if
+
+				# the write has probably not been done
+				if (self.__shadow != None) and (a == 0):
+					self.shadow_invalidate(reg)
+				# end if
+			# end if
+		# end for
+
+		if errors:
+			# late replies can still arrive: wait for them, so the next
+			# command gets its own reply
+			if timedout == True:
+				self.__drainrx(tx)
+			# end if
+
+			raise PipelineError(errors)
+		# end if
+	# end pipeline flush
+
+
+	# get the depth of pipelined write mode, 0 if pipelining is disabled
+	def pipeline_getdepth(self):
+		return self.__pipeline_depth
+	# end pipeline get depth
+
+
+	# collect all outstanding replies and stop pipelined write mode
+	def pipeline_stop(self):
+		self.__pipeline_depth=0
+		self.pipeline_flush()
+	# end pipeline stop
+
+
+	# pipelined write mode for a "with" block
+	@contextlib.contextmanager
+	def pipeline(self,depth=16):
+		self.pipeline_start(depth)
+		try:
+			yield self
+		except BaseException:
+			# collect the outstanding replies, but do not hide the exception
+			# of the "with" block by an error of the pipelined writes
+			self.__pipeline_depth=0
+			try:
+				self.pipeline_flush()
+			except Exception:
+				pass
+			# end try
+
+			raise
+		# end try
+
+		self.pipeline_stop()
+	# end pipeline
+
+
+	#######################
+	# Part 14: device snapshot
+
+	# register blocks read by snapshot(): (first register, number of registers)
+	# note: the system parameters are read one register higher then they are
+	# written (see part 11)
+	__snapshot_blocks=((0,2),(20,14),(36,21),(80,10))
+
+	# read a number of register blocks, one query per block
+	# returns a dictionary register -> value
+	def __readblocks(self,blocks):
+		regs={}
+		for (reg,n) in blocks:
+			data=self.__getdata(reg,n)
+
+			if n == 1: data=[data]
+			for (i,value) in enumerate(data):
+				regs[reg+i]=value
+			# end for
+		# end for
+
+		return regs
+	# end read blocks
+
+
+	# get the state of all known registers of the device in one DeviceState record,
+	# using one query per block of registers (0-1, 20-33, 36-56, 80-89)
+	def snapshot(self, bugfix=True):
+		if type(bugfix) != bool: raise TypeError(bugfix)
+
+		blocks=jds6600.__snapshot_blocks
+		if bugfix == False:
+			# system parameters are in registers 51 to 55
+			blocks=((0,2),(20,14),(36,20),(80,10))
+		# end if
+
+		r=self.__readblocks(blocks)
+
+		# system parameters: register number for reading
+		sysreg=jds6600.SYSTEM_SOUND+1 if bugfix == True else jds6600.SYSTEM_SOUND
+
+		return DeviceState(
+			r[jds6600.DEVICETYPE],
+			r[jds6600.SERIALNUMBER],
+			self.__decode_wavestate([r[reg] for reg in range(jds6600.CHANNELENABLE,jds6600.PHASE+1)]),
+			self.__decode_action(r[jds6600.ACTION]),
+			self.__decode_mode(r[jds6600.MODE]),
+			MeasureState(
+				self.__decode_list(r[jds6600.MEASURE_COUP],jds6600.__measure_coupling),
+				r[jds6600.MEASURE_GATE]/100,
+				self.__decode_list(r[jds6600.MEASURE_MODE],jds6600.__measure_mode)),
+			SweepState(
+				r[jds6600.SWEEP_STARTFREQ]/100,
+				r[jds6600.SWEEP_ENDFREQ]/100,
+				r[jds6600.SWEEP_TIME]/10,
+				self.__decode_list(r[jds6600.SWEEP_DIRECTION],jds6600.__sweep_direction),
+				self.__decode_list(r[jds6600.SWEEP_MODE],jds6600.__sweep_mode)),
+			PulseState(
+				self.__decode_pulsetime(r[jds6600.PULSE_PULSEWIDTH]),
+				self.__decode_pulsetime(r[jds6600.PULSE_PERIOD]),
+				r[jds6600.PULSE_OFFSET],
+				r[jds6600.PULSE_AMPLITUDE]/100),
+			BurstState(
+				r[jds6600.BURST_NUMBER],
+				self.__decode_list(r[jds6600.BURST_MODE],jds6600.__burst_mode)),
+			SystemState(
+				self.__decode_list(r[sysreg],(False,True))[1],
+				r[sysreg+1],
+				self.__decode_list(r[sysreg+2],jds6600.__system_language),
+				tuple(self.__decode_sync(r[sysreg+3])),
+				r[sysreg+4]),
+			r[jds6600.COUNTER_DATA_COUNTER],
+			MeasureData(
+				r[jds6600.MEASURE_DATA_FREQ_LOWRES]/10,
+				r[jds6600.MEASURE_DATA_FREQ_HIGHRES]/1000,
+				r[jds6600.MEASURE_DATA_PW1]/100,
+				r[jds6600.MEASURE_DATA_PW0]/100,
+				r[jds6600.MEASURE_DATA_PERIOD]/100,
+				r[jds6600.MEASURE_DATA_DUTYCYCLE]/10,
+				r[jds6600.MEASURE_DATA_U1],
+				r[jds6600.MEASURE_DATA_U2],
+				r[jds6600.MEASURE_DATA_U3]))
+	# end snapshot
+
+
+	#######################
+	# Part 15: register shadow
+
+	# The register shadow is an in-memory copy of the device registers. It is
+	# filled by reads and updated by writes done via this object, so repeated
+	# get-functions and the mode-checks done before setfrequency, sweep_start,
+	# ... are answered without a query to the device.
+	# Changes done on the front panel of the device are not seen: use
+	# shadow_invalidate() or a maximum age to deal with this
+
+	# registers that are never shadowed: UI registers, registers that start
+	# an action when written (counter reset, profiles) and measured data
+	__shadow_volatile=(34,35,COUNTER_RESETCOUNTER,PROFILE_SAVE,PROFILE_LOAD,PROFILE_CLEAR)+tuple(range(80,100))
+
+	# enable the register shadow
+	# maxage: maximum age of a shadowed value in seconds, None = no maximum
+	def shadow_enable(self,maxage=None):
+		if (maxage != None) and (type(maxage) != int) and (type(maxage) != float): raise TypeError(maxage)
+		if (maxage != None) and (maxage <= 0): raise ValueError(maxage)
+
+		self.__shadow_maxage=maxage
+
+		# do not throw away the shadow if it is already enabled
+		if self.__shadow == None:
+			self.__shadow={}
+		# end if
+	# end shadow enable
+
+
+	# disable (and clear) the register shadow
+	def shadow_disable(self):
+		self.__shadow=None
+	# end shadow disable
+
+
+	# is the register shadow enabled?
+	def shadow_getenabled(self):
+		return self.__shadow != None
+	# end shadow get enabled
+
+
+	# forget one register (reg), or all registers (reg=None)
+	def shadow_invalidate(self,reg=None):
+		if (reg != None) and (type(reg) != int): raise TypeError(reg)
+
+		if self.__shadow == None:
+			return
+		# end if
+
+		if reg == None:
+			self.__shadow.clear()
+		else:
+			self.__shadow.pop(reg,None)
+		# end else - if
+	# end shadow invalidate
+
+
+	# get "n" registers from the shadow, in the same format as __getdata
+	# returns None if not all registers are in the shadow
+	def __shadow_get(self,reg,n):
+		if self.__shadow_maxage != None:
+			oldest=time.monotonic()-self.__shadow_maxage
+		# end if
+
+		ret=[]
+		for r in range(reg,reg+n):
+			try:
+				(value,timestamp)=self.__shadow[r]
+			except KeyError:
+				return None
+			# end try
+
+			if (self.__shadow_maxage != None) and (timestamp < oldest):
+				return None
+			# end if
+
+			# return a copy of multi-value registers, as the caller may change it
+			ret.append(list(value) if type(value) == list else value)
+		# end for
+
+		return ret[0] if n == 1 else ret
+	# end shadow get
+
+
+	# store the values of registers read from the device, starting at reg
+	def __shadow_put(self,reg,values):
+		now=time.monotonic()
+
+		for (r,value) in enumerate(values,reg):
+			if r not in jds6600.__shadow_volatile:
+				self.__shadow[r]=(list(value) if type(value) == list else value,now)
+			# end if
+		# end for
+	# end shadow put
+
+
+	# update the shadow for a value written to a register
+	def __shadow_write(self,reg,val):
+		if reg == jds6600.PROFILE_LOAD:
+			# all registers change when a profile is loaded
+			self.__shadow.clear()
+			return
+		# end if
+
+		if jds6600.SYSTEM_SOUND <= reg <= jds6600.SYSTEM_ARBMAXNUM:
+			# system parameters are read from another register then they are
+			# written to (see part 11), so just forget them
+			self.shadow_invalidate(reg)
+			self.shadow_invalidate(reg+1)
+			return
+		# end if
+
+		value=self.__val2reg(reg,val)
+
+		if value == None:
+			self.shadow_invalidate(reg)
+		else:
+			self.__shadow_put(reg,[value])
+		# end else - if
+	# end shadow write
+
+
+	# convert a value as written to a register into the value received when
+	# reading that register. Returns None if this is not possible
+	def __val2reg(self,reg,val):
+		try:
+			value=[int(v) for v in val.split(",")]
+		except ValueError:
+			return None
+		# end try
+
+		if len(value) == 1:
+			value=value[0]
+		# end if
+
+		if reg == jds6600.MODE:
+			# the mode is written as modeid, but read as (index in "modes") * 8
+			for (i,(modeid,modetxt)) in enumerate(jds6600.__modes):
+				if modeid == value:
+					return i<<3
+				# end if
+			# end for
+
+			return None
+		# end if
+
+		return value
+	# end val2reg
+
+
+	#######################
+	# Part 16: apply a configuration
+
+	# parameters for apply_state(): (name, set-function, fixed arguments, register)
+	# listed in the order they are written
+	__apply_params=(
+		("channelenable","setchannelenable",(),CHANNELENABLE),
+		("waveform1","setwaveform",(1,),WAVEFORM1),
+		("waveform2","setwaveform",(2,),WAVEFORM2),
+		("frequency1","setfrequency",(1,),FREQUENCY1),
+		("frequency2","setfrequency",(2,),FREQUENCY2),
+		("amplitude1","setamplitude",(1,),AMPLITUDE1),
+		("amplitude2","setamplitude",(2,),AMPLITUDE2),
+		("offset1","setoffset",(1,),OFFSET1),
+		("offset2","setoffset",(2,),OFFSET2),
+		("dutycycle1","setdutycycle",(1,),DUTYCYCLE1),
+		("dutycycle2","setdutycycle",(2,),DUTYCYCLE2),
+		("phase","setphase",(),PHASE),
+		("measure_coupling","measure_setcoupling",(),MEASURE_COUP),
+		("measure_gate","measure_setgate",(),MEASURE_GATE),
+		("measure_mode","measure_setmode",(),MEASURE_MODE),
+		("sweep_startfreq","sweep_setstartfreq",(),SWEEP_STARTFREQ),
+		("sweep_endfreq","sweep_setendfreq",(),SWEEP_ENDFREQ),
+		("sweep_time","sweep_settime",(),SWEEP_TIME),
+		("sweep_direction","sweep_setdirection",(),SWEEP_DIRECTION),
+		("sweep_mode","sweep_setmode",(),SWEEP_MODE),
+		("pulse_pulsewidth","pulse_setpulsewidth",(),PULSE_PULSEWIDTH),
+		("pulse_period","pulse_setperiod",(),PULSE_PERIOD),
+		("pulse_offset","pulse_setoffset",(),PULSE_OFFSET),
+		("pulse_amplitude","pulse_setamplitude",(),PULSE_AMPLITUDE),
+		("burst_number","burst_setnumberofbursts",(),BURST_NUMBER),
+		("burst_mode","burst_setmode",(),BURST_MODE),
+		("system_sound","system_setsound",(),SYSTEM_SOUND),
+		("system_brightness","system_setbrightness",(),SYSTEM_BRIGHTNESS),
+		("system_language","system_setlanguage",(),SYSTEM_LANGUAGE),
+		("system_sync","system_setsync",(),SYSTEM_SYNC),
+		("system_arbmaxnum","system_setarbmaxnum",(),SYSTEM_ARBMAXNUM))
+
+	# start-functions for the "action" parameter of apply_state()
+	__apply_actions={"STOP":"stopallactions","COUNT":"counter_start","SWEEP":"sweep_start","PULSE":"pulse_start","BURST":"burst_start"}
+
+
+	# call a set-function in capture mode: returns the write commands it would send
+	def __capturewrites(self,function,args):
+		self.__capture=[]
+		try:
+			getattr(self,function)(*args)
+			return self.__capture
+		finally:
+			self.__capture=None
+		# end try
+	# end capture writes
+
+
+	# bring the device in the configuration described by "desired", only
+	# writing the parameters that are different from the current configuration
+	#
+	# desired: dictionary parameter name -> value. The value is passed to the
+	# set-function of the parameter (a tuple is passed as multiple arguments),
+	# so the same validation and units apply. The "mode" parameter is set first
+	# (stopping any action), the "action" parameter last. All parameters are
+	# checked before the first write: when one is rejected, nothing is written.
+	#
+	# returns a list of (parameter, register, value) for every parameter written
+	def apply_state(self,desired,bugfix=True):
+		if type(desired) != dict: raise TypeError(desired)
+		if type(bugfix) != bool: raise TypeError(bugfix)
+
+		params=[]
+		for (name,function,fixedargs,reg) in jds6600.__apply_params:
+			if name in desired:
+				value=desired[name]
+				args=fixedargs+(value if type(value) == tuple else (value,))
+				params.append((name,function,args,reg))
+			# end if
+		# end for
+
+		for name in desired:
+			if (name not in ("mode","action")) and (name not in [p[0] for p in params]):
+				errmsg="Unknown parameter: "+str(name)
+				raise ValueError(errmsg)
+			# end if
+		# end for
+
+		if ("action" in desired) and (desired["action"] not in jds6600.__apply_actions):
+			errmsg="Unknown action: "+str(desired["action"])
+			raise ValueError(errmsg)
+		# end if
+
+		# read the current configuration: wave and mode registers, and the
+		# other menus only if needed
+		blocks=[(jds6600.CHANNELENABLE,jds6600.MODE-jds6600.CHANNELENABLE+1)]
+		if [p for p in params if jds6600.MEASURE_COUP <= p[3] <= jds6600.BURST_MODE]:
+			blocks.append((jds6600.MEASURE_COUP,jds6600.BURST_MODE-jds6600.MEASURE_COUP+1))
+		# end if
+
+		# system parameters are read one register higher then they are written
+		sysoffset=1 if bugfix == True else 0
+		if [p for p in params if p[3] >= jds6600.SYSTEM_SOUND]:
+			blocks.append((jds6600.SYSTEM_SOUND+sysoffset,jds6600.SYSTEM_ARBMAXNUM-jds6600.SYSTEM_SOUND+1))
+		# end if
+
+		# use a temporary register shadow, so the mode-checks done by the
+		# set-functions do not query the device again
+		tempshadow = self.__shadow == None
+		if tempshadow == True:
+			self.__shadow={}
+			self.__shadow_maxage=None
+		# end if
+
+		# use pipelined writes, unless already done by the caller
+		temppipeline = self.__pipeline_depth == 0
+		if temppipeline == True:
+			self.pipeline_start()
+		# end if
+
+		report=[]
+		try:
+			current=self.__readblocks(blocks)
+			currentmode=self.__decode_mode(current[jds6600.MODE])[0]
+
+			# check all parameters before anything is written: capturing the
+			# writes of a set-function does all its checks. A new mode is put
+			# in the shadow meanwhile, so the mode-checks of the set-functions
+			# (e.g. setfrequency in sweep mode) are done against the new mode
+
+			# changing the mode stops all actions (see setmode)
+			modewrite=None
+			if "mode" in desired:
+				for (reg,val,a) in self.__capturewrites("setmode",(desired["mode"],)):
+					if (reg == jds6600.MODE) and (int(val) != currentmode):
+						modewrite=(reg,val)
+					# end if
+				# end for
+			# end if
+
+			changes=[]
+			oldmode=self.__shadow.get(jds6600.MODE)
+			try:
+				if modewrite != None:
+					self.__shadow_write(*modewrite)
+				# end if
+
+				for (name,function,args,reg) in params:
+					readreg=reg+sysoffset if reg >= jds6600.SYSTEM_SOUND else reg
+
+					for (wreg,val,a) in self.__capturewrites(function,args):
+						if (wreg == reg) and (self.__val2reg(wreg,val) != current.get(readreg)):
+							changes.append((name,function,args,reg,val))
+							break
+						# end if
+					# end for
+				# end for
+
+				# the mode write stops the running action first
+				action=None
+				if "action" in desired:
+					action=desired["action"]
+					if modewrite != None:
+						currentaction="STOP"
+					else:
+						currentaction=self.__decode_action(current[jds6600.ACTION])
+					# end else - if
+
+					if currentaction == action:
+						action=None
+					else:
+						self.__capturewrites(jds6600.__apply_actions[action],())
+					# end else - if
+				# end if
+			finally:
+				if oldmode == None:
+					self.__shadow.pop(jds6600.MODE,None)
+				else:
+					self.__shadow[jds6600.MODE]=oldmode
+				# end else - if
+			# end try
+
+			# all checks passed: write
+			if modewrite != None:
+				self.setmode(desired["mode"])
+				report.append(("mode",jds6600.MODE,modewrite[1]))
+			# end if
+
+			for (name,function,args,reg,val) in changes:
+				getattr(self,function)(*args)
+				report.append((name,reg,val))
+			# end for
+
+			if action != None:
+				getattr(self,jds6600.__apply_actions[action])()
+				report.append(("action",jds6600.ACTION,jds6600.__action[action]))
+			# end if
+
+		finally:
+			if temppipeline == True:
+				self.pipeline_stop()
+			# end if
+
+			if tempshadow == True:
+				self.__shadow=None
+			# end if
+		# end try
+
+		return report
+	# end apply state
+
+
+	#######################
+	# Part 17: timeouts
+
+	# By default, the time to wait for a reply is derived from the size of the
+	# command and the expected reply, the baudrate and the latency of the link,
+	# learned from earlier replies. So a lost reply of a register read is
+	# detected fast, while the reply of an arbitrary waveform read (about 10 KB)
+	# gets the time it needs.
+	# The timeout is set on the serial port (attribute "timeout") before every
+	# command.
+
+	# maximum size of replies, in bytes (including "\r\n")
+	__replysize_reg=24 # per register
+	__replysize_arb=10248 # ":bNN=" + 2048 values of up to 4 digits and ","
+	__replysize_ok=5
+
+	# waiting time on top of the transfer time, in seconds: minimum, and
+	# maximum (also used before the latency has been learned)
+	__timeout_margin_min=0.05
+	__timeout_margin_max=1
+
+
+	# set the timeout of the serial port for a command of "tx" bytes, followed
+	# by a reply of (at most) "rx" bytes, and start measuring the latency
+	# (unless "learn" is False)
+	def __starttimeout(self,tx,rx,learn=True):
+		if self.__timeout_fixed != None:
+			timeout=self.__timeout_fixed
+		else:
+			if self.__latency == None:
+				margin=jds6600.__timeout_margin_max
+			else:
+				margin=self.__latency+4*self.__latency_dev
+				margin=min(max(margin,jds6600.__timeout_margin_min),jds6600.__timeout_margin_max)
+			# end else - if
+
+			# round up to 10 ms, so the port is not reconfigured for every command
+			timeout=math.ceil((tx+rx)*self.__bytetime*100+margin*100)/100
+		# end else - if
+
+		if timeout != self.__timeout_current:
+			self.ser.timeout=timeout
+			self.__timeout_current=timeout
+		# end if
+
+		self.__timeout_start=(time.perf_counter(),tx) if learn == True else None
+	# end start timeout
+
+
+	# a reply of "rx" bytes has been received: learn the latency
+	# (the time the reply took, apart from the transfer time)
+	def __endtimeout(self,rx):
+		if self.__timeout_start == None:
+			return
+		# end if
+
+		(start,tx)=self.__timeout_start
+		self.__timeout_start=None
+
+		latency=max(time.perf_counter()-start-(tx+rx)*self.__bytetime,0)
+
+		# moving average of the latency and its deviation
+		if self.__latency == None:
+			self.__latency=latency
+			self.__latency_dev=latency/2
+		else:
+			self.__latency_dev=0.75*self.__latency_dev+0.25*abs(self.__latency-latency)
+			self.__latency=0.875*self.__latency+0.125*latency
+		# end else - if
+	# end end timeout
+
+
+	# no (complete) reply received within the timeout: wait longer next time
+	def __timedout(self):
+		self.__timeout_start=None
+
+		if self.__latency != None:
+			self.__latency_dev=min(max(2*self.__latency_dev,jds6600.__timeout_margin_min),jds6600.__timeout_margin_max)
+		# end if
+	# end timed out
+
+
+	# use a fixed timeout (in seconds) for every reply, or None (default) for
+	# a timeout derived from the size of the reply and the learned latency
+	def timeout_set(self,timeout=None):
+		if timeout != None:
+			if (type(timeout) != int) and (type(timeout) != float): raise TypeError(timeout)
+			if not (timeout > 0): raise ValueError(timeout)
+		# end if
+
+		self.__timeout_fixed=timeout
+	# end timeout set
+
+
+	# get the fixed timeout, None if the timeout is derived from the reply size
+	def timeout_get(self):
+		return self.__timeout_fixed
+	# end timeout get
+
+
+	# get the learned latency of the link: (average, mean deviation) in seconds
+	# None if no reply has been received yet
+	def timeout_getlatency(self):
+		if self.__latency == None:
+			return None
+		# end if
+
+		return (self.__latency,self.__latency_dev)
+	# end timeout get latency
+
 	##################################
 
 # end class jds6600
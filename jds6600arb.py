@@ -0,0 +1,543 @@
+# jds6600arb.py
+# use a large library of arbitrary waveforms with the 60 arbitrary waveform
+# slots of a JDS6600 signal generator
+
+# published under MIT license. See file "LICENSE" for full license text
+
+# The ArbSlotManager class uses the arbitrary waveform slots of the device as
+# a cache: a waveform is only uploaded (arb_setwave) when it is not in one of
+# the slots yet, replacing the least recently used slot.
+#
+#	arb = ArbSlotManager(jds)
+#	arb.add_waveform("ramp",[i*2 for i in range(2048)])
+#	arb.use_waveform("ramp",1)		# channel 1 outputs "ramp"
+#	arb.use_waveform(samples,2)		# samples: 2048 values, 0 to 4095
+#
+# The contents of the slots is tracked in a manifest (a hash of the waveform
+# per slot), stored as a json file per device (serial number), so it is not
+# needed to read back the slots after a restart.
+# Note: slots changed by other means (front panel, other programs) are not
+# seen: use forget() to clear the manifest.
+#
+# arb_backup() and arb_restore() save and restore the slots to/from a backup
+# file: a header, a table with a crc32 per slot, and the waveforms of slots
+# 1 to 60 (2048 uint16 values each, little endian) starting at offset 1024, so
+# the file can be used with mmap (see open_backup()) or numpy:
+#	numpy.memmap(path,dtype="<u2",mode="r",offset=1024,shape=(60,2048))
+# Both resume after an interruption: a backup keeps the slots already in the
+# file, a restore skips the slots already holding the waveform (manifest).
+
+
+import array
+import collections
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+from jds6600 import arb_samples
+
+
+# result of a backup or restore: number of slots transferred and skipped
+# (already done), time in seconds
+TransferReport=collections.namedtuple("TransferReport",("transferred","skipped","elapsed"))
+
+
+
+###################
+# ArbBackup class #
+###################
+
+class ArbBackup:
+	'contents of a backup file, see open_backup()'
+
+	# serialnumber: serial number of the device
+	# slots: slots in the file (slot -> crc32)
+	# data: all waveform data (memoryview of uint16, slot n at index (n-1)*2048)
+	# The file is mapped in memory until close() is called (or the end of a
+	# "with" block): data can not be used after that.
+	def __init__(self,serialnumber,slots,m,offset):
+		self.serialnumber=serialnumber
+		self.slots=slots
+
+		self.__mmap=m
+		self.__views=[memoryview(m)]
+		self.__views.append(self.__views[0][offset:])
+		self.data=self.__views[1].cast('H')
+	# end constructor
+
+
+	# release the data and unmap the file
+	def close(self):
+		if self.__mmap == None:
+			return
+		# end if
+
+		self.data.release()
+		for view in reversed(self.__views):
+			view.release()
+		# end for
+
+		self.__mmap.close()
+		self.__mmap=None
+	# end close
+
+	def __enter__(self):
+		return self
+	# end enter
+
+	def __exit__(self,exc_type,exc,tb):
+		self.close()
+	# end exit
+
+# end class ArbBackup
+
+
+########################
+# ArbSlotManager class #
+########################
+
+class ArbSlotManager:
+	'arbitrary waveform slots of a jds6600, used as a cache'
+
+	def __init__(self,jds,manifestdir="~/.jds6600",slots=None):
+		if type(manifestdir) != str: raise TypeError(manifestdir)
+
+		# slots managed (default all), e.g. to keep some slots for other use
+		if slots == None:
+			slots=range(1,61)
+		# end if
+
+		slots=list(slots)
+		if not slots: raise ValueError(slots)
+		for slot in slots:
+			if type(slot) != int: raise TypeError(slot)
+			if not (1 <= slot <= 60): raise ValueError(slot)
+		# end for
+
+		self.jds=jds
+		self.slots=slots
+
+		# waveforms that can be used by name: name -> samples
+		self.library={}
+
+		# one manifest per device
+		serialnumber=jds.getinfo_serialnumber()
+		self.manifestfile=os.path.join(os.path.expanduser(manifestdir),"jds6600-arb-{}.json".format(serialnumber))
+
+		self.manifest={"serialnumber": serialnumber, "clock": 0, "slots": {}}
+		if os.path.exists(self.manifestfile):
+			with open(self.manifestfile) as f:
+				manifest=json.load(f)
+			# end with
+
+			if manifest.get("serialnumber") == serialnumber:
+				self.manifest=manifest
+			# end if
+		# end if
+	# end constructor
+
+
+	#####
+	# support functions
+
+	# hash of a waveform (array('H')), independent of the byte order of the host
+	@staticmethod
+	def __hash(samples):
+		if sys.byteorder == "big":
+			samples=array.array('H',samples)
+			samples.byteswap()
+		# end if
+
+		return hashlib.sha256(samples.tobytes()).hexdigest()
+	# end hash
+
+
+	# write the manifest file (replacing the old file only when complete)
+	def __save(self):
+		os.makedirs(os.path.dirname(self.manifestfile),exist_ok=True)
+
+		tmpfile=self.manifestfile+".tmp"
+		with open(tmpfile,"w") as f:
+			json.dump(self.manifest,f,indent=1)
+		# end with
+		os.replace(tmpfile,self.manifestfile)
+	# end save
+
+
+	# slot holding a waveform (by hash), None if not loaded
+	def __find(self,hash):
+		for slot in self.slots:
+			entry=self.manifest["slots"].get(str(slot))
+			if (entry != None) and (entry["hash"] == hash):
+				return slot
+			# end if
+		# end for
+
+		return None
+	# end find
+
+
+	# mark a slot as used now
+	def __touch(self,slot):
+		self.manifest["clock"] += 1
+		self.manifest["slots"][str(slot)]["used"]=self.manifest["clock"]
+	# end touch
+
+
+	#####
+	# public API
+
+	# add a waveform to the library, so it can be used by name
+	def add_waveform(self,name,wave):
+		if type(name) != str: raise TypeError(name)
+
+		self.library[name]=arb_samples(wave)
+	# end add waveform
+
+
+	# get the slot holding a waveform (name or samples), None if not loaded
+	def find_waveform(self,wave):
+		if type(wave) == str:
+			try:
+				wave=self.library[wave]
+			except KeyError:
+				errmsg="Unknown waveform: "+wave
+				raise ValueError(errmsg)
+			# end try
+		# end if
+
+		return self.__find(self.__hash(arb_samples(wave)))
+	# end find waveform
+
+
+	# load a waveform (name or samples) into a slot, if not loaded yet
+	# the slots used by the channels (except "channel") are not replaced
+	# returns the slot
+	def __load(self,wave,channel):
+		name=None
+		if type(wave) == str:
+			name=wave
+			try:
+				wave=self.library[name]
+			except KeyError:
+				errmsg="Unknown waveform: "+name
+				raise ValueError(errmsg)
+			# end try
+		# end if
+
+		samples=arb_samples(wave)
+		hash=self.__hash(samples)
+
+		slot=self.__find(hash)
+		if slot == None:
+			# slots in use
+			keep=[]
+			for ch in (1,2):
+				if ch != channel:
+					(waveform,wavename)=self.jds.getwaveform(ch)
+					keep.append(waveform-100)
+				# end if
+			# end for
+
+			# replace the least recently used slot (slots not in the manifest
+			# first), except the slots in use
+			candidates=[s for s in self.slots if s not in keep]
+			if not candidates:
+				raise RuntimeError("no arbitrary waveform slot available")
+			# end if
+
+			slot=min(candidates,key=lambda s: self.manifest["slots"].get(str(s),{}).get("used",0))
+
+			# the contents of the slot is unknown until the upload is done
+			self.manifest["slots"].pop(str(slot),None)
+			self.__save()
+
+			self.jds.arb_setwave(slot,samples)
+			self.manifest["slots"][str(slot)]={"hash": hash, "name": name}
+		elif name != None:
+			self.manifest["slots"][str(slot)]["name"]=name
+		# end elif - if
+
+		self.__touch(slot)
+		self.__save()
+
+		return slot
+	# end load
+
+
+	# load a waveform (name or samples) into a slot, if not loaded yet,
+	# without replacing the slots used by the channels
+	# returns the slot
+	def load_waveform(self,wave):
+		return self.__load(wave,None)
+	# end load waveform
+
+
+	# output a waveform (name or samples) on a channel, loading it into a
+	# slot if needed
+	# returns the slot
+	def use_waveform(self,wave,channel):
+		if type(channel) != int: raise TypeError(channel)
+		if not (channel in (1,2)): raise ValueError(channel)
+
+		slot=self.__load(wave,channel)
+		self.jds.setwaveform(channel,100+slot)
+
+		return slot
+	# end use waveform
+
+
+	#####
+	# backup and restore
+
+	# backup file layout: header, one table entry per slot (crc32, 1 if the
+	# slot is in the file), waveform data at offset 1024
+	__backup_magic=b"JDS6600A"
+	__backup_version=1
+	__backup_header=struct.Struct("<8sHHHHQ") # magic, version, slots, samples, reserved, serial number
+	__backup_entry=struct.Struct("<II")
+	__backup_data=1024
+	__backup_size=1024+60*2048*2
+
+
+	# check a list of slots (default: all)
+	def __slotlist(self,slots):
+		if slots == None:
+			return list(range(1,61))
+		# end if
+
+		slots=list(slots)
+		for slot in slots:
+			if type(slot) != int: raise TypeError(slot)
+			if not (1 <= slot <= 60): raise ValueError(slot)
+		# end for
+
+		return slots
+	# end slot list
+
+
+	# read the header and the table of a backup file
+	# returns (serial number, {slot: crc32} of the slots in the file)
+	@staticmethod
+	def __readheader(f):
+		header=ArbSlotManager.__backup_header
+		entry=ArbSlotManager.__backup_entry
+
+		data=f.read(header.size+60*entry.size)
+		if len(data) != header.size+60*entry.size:
+			raise ValueError("not a jds6600 arbitrary waveform backup")
+		# end if
+
+		(magic,version,nslots,nsamples,reserved,serialnumber)=header.unpack_from(data)
+		if (magic != ArbSlotManager.__backup_magic) or (nslots != 60) or (nsamples != 2048):
+			raise ValueError("not a jds6600 arbitrary waveform backup")
+		# end if
+
+		if version != ArbSlotManager.__backup_version:
+			errmsg="unsupported backup version: "+str(version)
+			raise ValueError(errmsg)
+		# end if
+
+		crcs={}
+		for slot in range(1,61):
+			(crc,present)=entry.unpack_from(data,header.size+(slot-1)*entry.size)
+			if present == 1:
+				crcs[slot]=crc
+			# end if
+		# end for
+
+		return (serialnumber,crcs)
+	# end read header
+
+
+	# open a backup file, using mmap
+	# returns ArbBackup (serialnumber, slots, data), to be closed after use
+	# note: the data is little endian
+	@staticmethod
+	def open_backup(path):
+		with open(path,"rb") as f:
+			(serialnumber,crcs)=ArbSlotManager.__readheader(f)
+
+			if os.fstat(f.fileno()).st_size < ArbSlotManager.__backup_size:
+				raise ValueError("backup file too short")
+			# end if
+
+			m=mmap.mmap(f.fileno(),ArbSlotManager.__backup_size,access=mmap.ACCESS_READ)
+		# end with
+
+		backup=ArbBackup(serialnumber,{},m,ArbSlotManager.__backup_data)
+
+		# slots with a wrong crc (e.g. interrupted write) are not in the backup
+		try:
+			for (slot,crc) in crcs.items():
+				if zlib.crc32(backup.data[(slot-1)*2048:slot*2048]) == crc:
+					backup.slots[slot]=crc
+				# end if
+			# end for
+		except:
+			backup.close()
+			raise
+		# end try
+
+		return backup
+	# end open backup
+
+
+	# the waveform of a slot is known (e.g. read from the device): update the
+	# manifest
+	def __known(self,slot,hash):
+		entry=self.manifest["slots"].get(str(slot))
+		if (entry == None) or (entry["hash"] != hash):
+			self.manifest["slots"][str(slot)]={"hash": hash, "name": None}
+		# end if
+	# end known
+
+
+	# save the arbitrary waveforms to a backup file
+	# A backup to an existing backup file of this device keeps the slots
+	# already in the file (resume), unless resume is False.
+	# progress: called after every slot with (slots done, total, slots per
+	# second transferred)
+	# returns TransferReport
+	def arb_backup(self,path,slots=None,resume=True,progress=None):
+		if type(path) != str: raise TypeError(path)
+		if type(resume) != bool: raise TypeError(resume)
+		slots=self.__slotlist(slots)
+
+		serialnumber=self.manifest["serialnumber"]
+		header=ArbSlotManager.__backup_header
+		entry=ArbSlotManager.__backup_entry
+
+		done={}
+		if (resume == True) and os.path.exists(path):
+			try:
+				with self.open_backup(path) as backup:
+					if backup.serialnumber == serialnumber:
+						done=backup.slots
+					# end if
+				# end with
+			except ValueError:
+				pass
+			# end try
+		# end if
+
+		if not done:
+			# new (empty) backup file
+			with open(path,"wb") as f:
+				f.write(header.pack(ArbSlotManager.__backup_magic,ArbSlotManager.__backup_version,60,2048,0,serialnumber))
+				f.write(entry.pack(0,0)*60)
+				f.truncate(ArbSlotManager.__backup_size)
+			# end with
+		# end if
+
+		start=time.perf_counter()
+		transferred=0
+		skipped=0
+
+		with open(path,"r+b") as f:
+			for (i,slot) in enumerate(slots):
+				if slot in done:
+					skipped += 1
+				else:
+					samples=self.jds.arb_getwave(slot,"array")
+					self.__known(slot,self.__hash(samples))
+
+					if sys.byteorder == "big":
+						samples.byteswap()
+					# end if
+					data=samples.tobytes()
+
+					# first the data, then the table entry
+					f.seek(ArbSlotManager.__backup_data+(slot-1)*4096)
+					f.write(data)
+					f.seek(header.size+(slot-1)*entry.size)
+					f.write(entry.pack(zlib.crc32(data),1))
+					f.flush()
+					os.fsync(f.fileno())
+
+					transferred += 1
+				# end else - if
+
+				if progress != None:
+					elapsed=time.perf_counter()-start
+					progress(i+1,len(slots),transferred/elapsed if elapsed > 0 else 0)
+				# end if
+			# end for
+		# end with
+
+		self.__save()
+
+		return TransferReport(transferred,skipped,time.perf_counter()-start)
+	# end backup
+
+
+	# restore the arbitrary waveforms from a backup file
+	# Slots already holding the waveform (according to the manifest) are
+	# skipped, so an interrupted restore continues where it stopped.
+	# progress: called after every slot with (slots done, total, slots per
+	# second transferred)
+	# returns TransferReport
+	def arb_restore(self,path,slots=None,progress=None):
+		if type(path) != str: raise TypeError(path)
+
+		start=time.perf_counter()
+		transferred=0
+		skipped=0
+
+		with self.open_backup(path) as backup:
+			slots=[slot for slot in self.__slotlist(slots) if slot in backup.slots]
+
+			for (i,slot) in enumerate(slots):
+				samples=array.array('H')
+				samples.frombytes(backup.data[(slot-1)*2048:slot*2048].cast('B'))
+				if sys.byteorder == "big":
+					samples.byteswap()
+				# end if
+
+				hash=self.__hash(samples)
+				entry=self.manifest["slots"].get(str(slot))
+
+				if (entry != None) and (entry["hash"] == hash):
+					skipped += 1
+				else:
+					# the contents of the slot is unknown until the upload is done
+					self.manifest["slots"].pop(str(slot),None)
+					self.__save()
+
+					self.jds.arb_setwave(slot,samples)
+					self.__known(slot,hash)
+					self.__save()
+
+					transferred += 1
+				# end else - if
+
+				if progress != None:
+					elapsed=time.perf_counter()-start
+					progress(i+1,len(slots),transferred/elapsed if elapsed > 0 else 0)
+				# end if
+			# end for
+		# end with
+
+		return TransferReport(transferred,skipped,time.perf_counter()-start)
+	# end restore
+
+
+	# forget the contents of one slot, or all slots if no slot is given
+	# (e.g. after the slots have been changed by other means)
+	def forget(self,slot=None):
+		if slot == None:
+			self.manifest["slots"]={}
+		else:
+			if type(slot) != int: raise TypeError(slot)
+			self.manifest["slots"].pop(str(slot),None)
+		# end else - if
+
+		self.__save()
+	# end forget
+
+# end class ArbSlotManager
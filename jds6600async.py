@@ -0,0 +1,388 @@
+# jds6600async.py
+# asyncio client to remote-control a JDS6600 signal generator
+
+# published under MIT license. See file "LICENSE" for full license text
+
+# The AsyncJDS6600 class offers the same public API as the jds6600 class, but
+# all functions are coroutines:
+#	j = AsyncJDS6600("/dev/ttyUSB0")
+#	await j.setfrequency(1,1000)
+#	freq = await asyncio.wait_for(j.getfrequency(1),0.5)
+#
+# How it works:
+# The validation, encoding and decoding of the jds6600 class is reused as-is.
+# A function of the jds6600 class is executed on a "replay" port that does not
+# do any I/O itself: when the function needs a reply that has not been received
+# yet, it is stopped, the commands are send and the reply is awaited on the
+# event loop, and the function is run again from the start. During the re-run,
+# all commands and replies up to that point are replayed from memory.
+#
+# Callers are served one at a time per device. A call that is cancelled (e.g.
+# by asyncio.wait_for) leaves the commands it has send on the line: the replies
+# of these commands are discarded before the next call starts, so the line
+# stays in sync.
+#
+# Notes:
+# - serial I/O is done non-blocking on the event loop (POSIX only)
+# - the pipelined write mode (pipeline*) is not available: concurrent callers
+#		are served one at a time, but do not block the event loop
+# - the DEBUG functions are not available
+# - the timeout functions (timeout_*) are not available: the time to wait for
+#		a reply is set with the "timeout" argument
+# - measure_stream is not available: poll measure_getall on the event loop
+
+
+import asyncio
+import collections
+import copy
+import os
+
+import serial
+
+from jds6600 import jds6600
+
+
+###########
+#  Errors #
+###########
+
+class ReplayError(RuntimeError):
+	# called when a function does not send the same commands when it is
+	# re-run (see "How it works" above)
+	pass
+
+
+# raised by the replay port when a function needs data that has not been
+# received yet
+class _NeedIO(Exception):
+	pass
+
+
+###############
+# replay port #
+###############
+
+class _ReplayPort:
+	'serial port replaying the commands and replies of a function'
+
+	is_open = True
+
+	def __init__(self):
+		self.timeout=1
+		self.clear()
+	# end constructor
+
+	# start a new function call
+	def clear(self):
+		self.sent=[] # commands send by the function, in order
+		self.replies=[] # lines received, None for a timeout
+		self.queue=[] # commands not yet send to the device
+		self.rewind()
+	# end clear
+
+	# start a (re-)run of the function
+	def rewind(self):
+		self.__wpos=0
+		self.__rpos=0
+	# end rewind
+
+	def write(self,data):
+		data=bytes(data)
+
+		if self.__wpos < len(self.sent):
+			# replay: the same command must be send again
+			if data != self.sent[self.__wpos]:
+				raise ReplayError(data)
+			# end if
+		else:
+			# new command
+			self.sent.append(data)
+			self.queue.append(data)
+		# end else - if
+
+		self.__wpos += 1
+		return len(data)
+	# end write
+
+	# replies are only read when the function asks for more data: nothing
+	# is waiting
+	@property
+	def in_waiting(self):
+		return 0
+	# end in_waiting
+
+	# returns one complete reply line per call
+	def read(self,size=1):
+		if self.__rpos >= len(self.replies):
+			raise _NeedIO()
+		# end if
+
+		line=self.replies[self.__rpos]
+		self.__rpos += 1
+
+		# a timeout returns no data, like a serial port does
+		return b'' if line == None else line
+	# end read
+
+# end class _ReplayPort
+
+
+# number of reply lines send by the device for a command
+def _replylines(command):
+	if command[1:2] == b'r':
+		# ":rNN=n." is answered with n+1 lines
+		return int(command[5:command.index(b'.')])+1
+	# end if
+
+	# all other commands are answered with one line
+	return 1
+# end replylines
+
+
+
+######################
+# AsyncJDS6600 class #
+######################
+
+class AsyncJDS6600:
+	'asyncio client for the jds6600'
+
+	def __init__(self,fname,timeout=1):
+		if (type(timeout) != int) and (type(timeout) != float): raise TypeError(timeout)
+		if not (timeout > 0): raise ValueError(timeout)
+
+		# the port is opened non-blocking, all waiting is done on the event loop
+		self.ser = serial.Serial(
+			port= fname,
+			baudrate=115200,
+			parity=serial.PARITY_NONE,
+			stopbits=serial.STOPBITS_ONE,
+			bytesize=serial.EIGHTBITS,
+			timeout=0		)
+		self.__fd=self.ser.fileno()
+
+		# timeout waiting for one reply line, in seconds
+		self.timeout=timeout
+
+		self.__port=_ReplayPort()
+		self.__dev=jds6600(self.__port)
+
+		# received data
+		self.__rxbuf=bytearray()
+		self.__lines=collections.deque()
+		self.__rxevent=None
+
+		# number of reply lines expected from commands send by calls that
+		# did not wait for them (cancelled or timed out)
+		self.__discard=0
+
+		self.__lock=None
+		self.__loop=None
+	# end constructor
+
+
+	# attach to the running event loop (on first use)
+	def __attach(self):
+		loop=asyncio.get_running_loop()
+
+		if self.__loop == None:
+			self.__loop=loop
+			self.__lock=asyncio.Lock()
+			self.__rxevent=asyncio.Event()
+			loop.add_reader(self.__fd,self.__readable)
+		elif self.__loop != loop:
+			raise RuntimeError("AsyncJDS6600 used from another event loop")
+		# end elif - if
+	# end attach
+
+
+	# close the serial port
+	def close(self):
+		if self.__loop != None:
+			self.__loop.remove_reader(self.__fd)
+			self.__loop=None
+		# end if
+
+		self.ser.close()
+	# end close
+
+	async def __aenter__(self):
+		return self
+	# end aenter
+
+	async def __aexit__(self,exc_type,exc,tb):
+		self.close()
+	# end aexit
+
+
+	#####
+	# low-level I/O
+
+	# called by the event loop when data can be read
+	def __readable(self):
+		try:
+			data=os.read(self.__fd,4096)
+		except BlockingIOError:
+			return
+		# end try
+
+		self.__rxbuf += data
+
+		# split off complete lines (including the "\n")
+		while True:
+			i=self.__rxbuf.find(b'\n')
+			if i < 0:
+				break
+			# end if
+
+			self.__lines.append(bytes(self.__rxbuf[:i+1]))
+			del self.__rxbuf[:i+1]
+		# end while
+
+		if self.__lines:
+			self.__rxevent.set()
+		# end if
+	# end readable
+
+
+	# get one line, None if nothing received within the timeout
+	async def __readline(self,timeout):
+		if not self.__lines:
+			self.__rxevent.clear()
+			try:
+				await asyncio.wait_for(self.__rxevent.wait(),timeout)
+			except asyncio.TimeoutError:
+				return None
+			# end try
+		# end if
+
+		return self.__lines.popleft()
+	# end readline
+
+
+	# write all data, waiting on the event loop if the port is busy
+	async def __write(self,data):
+		view=memoryview(data)
+
+		while view:
+			try:
+				n=os.write(self.__fd,view)
+				view=view[n:]
+			except BlockingIOError:
+				writable=self.__loop.create_future()
+				self.__loop.add_writer(self.__fd,writable.set_result,None)
+				try:
+					await writable
+				finally:
+					self.__loop.remove_writer(self.__fd)
+				# end try
+			# end try
+		# end while
+	# end write
+
+
+	# send all commands queued by the replay port
+	async def __sendqueue(self):
+		while self.__port.queue:
+			command=self.__port.queue.pop(0)
+
+			# from now on, the replies of this command will arrive
+			self.__discard += _replylines(command)
+
+			# a command is always send completely, also if the call is cancelled,
+			# so no partial command is left on the line
+			await asyncio.shield(self.__write(command))
+		# end while
+	# end sendqueue
+
+
+	# discard replies of commands of earlier calls that did not wait for them
+	async def __resync(self):
+		while self.__discard > 0:
+			line=await self.__readline(self.timeout)
+
+			if line == None:
+				# the replies will not come anymore
+				self.__lines.clear()
+				self.__rxbuf.clear()
+				self.__discard=0
+				return
+			# end if
+
+			self.__discard -= 1
+		# end while
+	# end resync
+
+
+	#####
+	# run a function of the jds6600 class
+
+	async def _call(self,name,args,kwargs):
+		self.__attach()
+
+		async with self.__lock:
+			await self.__resync()
+
+			port=self.__port
+			port.clear()
+			port.timeout=self.timeout
+
+			while True:
+				# every run of the function must start from the same state
+				state=copy.deepcopy({k: v for (k,v) in self.__dev.__dict__.items() if k != "ser"})
+				port.rewind()
+
+				try:
+					ret=getattr(self.__dev,name)(*args,**kwargs)
+				except _NeedIO:
+					self.__dev.__dict__.update(state)
+				else:
+					# commands that do not expect a reply are send as well
+					await self.__sendqueue()
+					return ret
+				# end try
+
+				await self.__sendqueue()
+
+				# wait for one line, and take all other lines already received
+				line=await self.__readline(self.timeout)
+				port.replies.append(line)
+
+				if line != None:
+					self.__discard -= 1
+					while self.__lines and (self.__discard > 0):
+						port.replies.append(self.__lines.popleft())
+						self.__discard -= 1
+					# end while
+				# end if
+			# end while
+		# end with
+	# end call
+
+# end class AsyncJDS6600
+
+
+# create the public API: every public function of the jds6600 class becomes
+# a coroutine with the same name and arguments
+def _asyncfunction(name):
+	async def function(self,*args,**kwargs):
+		return await self._call(name,args,kwargs)
+	# end function
+
+	function.__name__=name
+	function.__qualname__="AsyncJDS6600."+name
+	return function
+# end asyncfunction
+
+for _name in dir(jds6600):
+	if _name.startswith("_") or _name.startswith("DEBUG_") or _name.startswith("pipeline") or _name.startswith("timeout") or (_name == "measure_stream"):
+		continue
+	# end if
+
+	if callable(getattr(jds6600,_name)):
+		setattr(AsyncJDS6600,_name,_asyncfunction(_name))
+	else:
+		# register numbers
+		setattr(AsyncJDS6600,_name,getattr(jds6600,_name))
+	# end else - if
+# end for
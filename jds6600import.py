@@ -0,0 +1,379 @@
+# jds6600import.py
+# import a captured signal (WAV or CSV) as arbitrary waveform for a JDS6600
+# signal generator
+
+# published under MIT license. See file "LICENSE" for full license text
+
+# One period (or a window) of a captured signal is resampled to the 2048
+# points of an arbitrary waveform and quantised to 0 - 4095:
+#
+#	w = import_wave("capture.wav",start=0.5,frequency="auto")
+#	jds.arb_setwave(1,w.samples)
+#
+# The source file is read in chunks and only the part needed is read, so
+# large files are imported in bounded memory.
+# Resampling is done with an anti-aliased windowed-sinc filter (cut-off below
+# the Nyquist frequency of the 2048 points), applied circularly: the
+# selected part is handled as one period of a periodic signal.
+#
+# Note: needs numpy
+
+
+import collections
+import math
+import wave
+
+import numpy
+
+from jds6600synth import SAMPLES, quantise
+
+
+# result of import_wave()
+#	samples: numpy uint16 array, 2048 points, 0 - 4095
+#	stats: QuantiseStats (see jds6600synth)
+#	samplerate: samplerate of the source (Hz)
+#	start: first sample of the source used
+#	length: number of source samples resampled to 2048 points (one period)
+ImportedWave=collections.namedtuple("ImportedWave",("samples","stats","samplerate","start","length"))
+
+
+
+###########
+# sources #
+###########
+
+# open a WAV file (PCM, 8, 16, 24 or 32 bits)
+# returns (samplerate, number of samples, generator of chunks of samples of
+# one channel (numpy float arrays, -1 to 1))
+def open_wav(path,channel=0,chunk=65536):
+	f=wave.open(path,"rb")
+
+	try:
+		nchannels=f.getnchannels()
+		width=f.getsampwidth()
+		if not (0 <= channel < nchannels): raise ValueError(channel)
+		if width not in (1,2,3,4): raise ValueError("unsupported sample width: "+str(width))
+	except:
+		f.close()
+		raise
+	# end try
+
+	def chunks():
+		try:
+			while True:
+				data=f.readframes(chunk)
+				if not data:
+					return
+				# end if
+
+				raw=numpy.frombuffer(data,dtype=numpy.uint8).reshape(-1,nchannels,width)[:,channel,:]
+
+				if width == 1:
+					# 8 bits samples are unsigned
+					yield (raw[:,0].astype(float)-128)/128
+				else:
+					# little endian, signed: sign extend to 32 bits
+					pad=numpy.zeros((len(raw),4),dtype=numpy.uint8)
+					pad[:,4-width:]=raw
+					yield pad.view("<i4")[:,0].astype(float)/2**31
+				# end else - if
+			# end while
+		finally:
+			f.close()
+		# end try
+	# end chunks
+
+	return (f.getframerate(),f.getnframes(),chunks())
+# end open wav
+
+
+# open a CSV file, one sample per line
+#	column: column with the sample values
+#	samplerate: samplerate (Hz), or None to derive it from "timecolumn"
+#		(the time of the first two samples, in seconds)
+# Lines at the start that are not numeric (headers) are skipped.
+# returns (samplerate, None, generator of chunks of samples (numpy float arrays))
+def open_csv(path,column=0,samplerate=None,timecolumn=None,delimiter=",",chunk=65536):
+	if (samplerate == None) and (timecolumn == None):
+		raise ValueError("samplerate or timecolumn needed")
+	# end if
+
+	f=open(path)
+
+	try:
+		# skip headers, keep the first data lines
+		first=[]
+		for line in f:
+			fields=line.split(delimiter)
+			try:
+				values=[float(fields[c]) for c in ((column,) if timecolumn == None else (column,timecolumn))]
+			except (ValueError,IndexError):
+				if first:
+					raise
+				# end if
+				continue
+			# end try
+
+			first.append(values)
+			if (samplerate != None) or (len(first) == 2):
+				break
+			# end if
+		# end for
+
+		if not first:
+			raise ValueError("no data in "+path)
+		# end if
+
+		if samplerate == None:
+			if len(first) != 2: raise ValueError("need two samples to derive the samplerate")
+			if not (first[1][1] > first[0][1]): raise ValueError("time column not increasing")
+
+			samplerate=1/(first[1][1]-first[0][1])
+		# end if
+	except:
+		f.close()
+		raise
+	# end try
+
+	def chunks():
+		try:
+			yield numpy.array([v[0] for v in first])
+
+			lines=[]
+			for line in f:
+				if line.strip() == "":
+					continue
+				# end if
+
+				lines.append(line)
+				if len(lines) == chunk:
+					yield numpy.array([float(l.split(delimiter)[column]) for l in lines])
+					lines=[]
+				# end if
+			# end for
+
+			if lines:
+				yield numpy.array([float(l.split(delimiter)[column]) for l in lines])
+			# end if
+		finally:
+			f.close()
+		# end try
+	# end chunks
+
+	return (samplerate,None,chunks())
+# end open csv
+
+
+
+##############
+# resampling #
+##############
+
+class _Resampler:
+	'circular resampling of "length" input samples to "n" output samples'
+
+	def __init__(self,length,n=SAMPLES,taps=32,cutoff=0.9):
+		self.length=length
+		self.n=n
+		# input samples per output sample
+		self.ratio=length/n
+		# kernel: taps/2 zero crossings on both sides, in units of the lowest
+		# samplerate (input or output), cut-off frequency relative to its
+		# Nyquist frequency
+		self.halfwidth=taps/2
+		self.scale=max(self.ratio,1)
+		self.fc=cutoff/2
+
+		self.pos=0 # index of the next input sample
+		self.out=numpy.zeros(n)
+		self.weights=numpy.zeros(n)
+	# end constructor
+
+
+	# add input samples
+	# every input sample is added to all output samples in reach of the
+	# kernel: loop over the (few) offsets, vectorised over the input samples
+	def feed(self,x):
+		x=x[:max(0,math.ceil(self.length)-self.pos)]
+		if len(x) == 0:
+			return
+		# end if
+
+		i=self.pos+numpy.arange(len(x))
+		self.pos += len(x)
+
+		reach=self.halfwidth*self.scale
+		first=numpy.ceil((i-reach)/self.ratio).astype(numpy.int64)
+
+		for k in range(int(math.ceil(2*reach/self.ratio))+1):
+			j=first+k
+			s=(i-j*self.ratio)/self.scale
+			inside=numpy.abs(s) < self.halfwidth
+
+			# windowed sinc (blackman window)
+			w=2*self.fc*numpy.sinc(2*self.fc*s)*(0.42+0.5*numpy.cos(numpy.pi*s/self.halfwidth)+0.08*numpy.cos(2*numpy.pi*s/self.halfwidth))
+			w[~inside]=0
+
+			# circular: the end of the period continues at the start
+			j %= self.n
+			self.out += numpy.bincount(j,weights=w*x,minlength=self.n)
+			self.weights += numpy.bincount(j,weights=w,minlength=self.n)
+		# end for
+	# end feed
+
+
+	# all input samples added
+	def done(self):
+		return self.pos >= math.ceil(self.length)
+	# end done
+
+
+	# the output samples (normalised by the sum of the weights, so the gain is
+	# exactly 1 for every output sample)
+	def result(self):
+		return self.out/self.weights
+	# end result
+
+# end class _Resampler
+
+
+# estimate the period of a signal, in samples, from its autocorrelation
+# The highest peak of the autocorrelation (after the first zero crossing) is
+# at a multiple of the period: the period is the shortest fraction of it
+# where the autocorrelation is as high at every multiple.
+def estimate_period(x):
+	x=numpy.asarray(x,dtype=float)
+	x=x-x.mean()
+
+	n=len(x)
+	spectrum=numpy.fft.rfft(x,2*n)
+	acf=numpy.fft.irfft(spectrum*numpy.conj(spectrum))[:n]
+
+	# correct for the number of overlapping samples per lag, ignore lags with
+	# less then half of the samples
+	acf=acf[:n//2]/(n-numpy.arange(n//2))
+
+	negative=numpy.nonzero(acf < 0)[0]
+	if len(negative) == 0:
+		raise ValueError("no period found")
+	# end if
+	zero=negative[0]
+
+	highest=zero+numpy.argmax(acf[zero:])
+	if not (highest < len(acf)-1):
+		raise ValueError("no period found")
+	# end if
+
+	# parabolic interpolation of the peak
+	(a,b,c)=acf[highest-1:highest+2]
+	peak=highest+(0.5*(a-c)/(a-2*b+c) if (a-2*b+c) != 0 else 0)
+
+	# the autocorrelation must be high at all multiples of the period
+	for m in range(int(peak/zero),1,-1):
+		lags=numpy.round(numpy.arange(1,m)*(peak/m)).astype(numpy.int64)
+		if acf[lags].min() >= 0.9*acf[highest]:
+			return peak/m
+		# end if
+	# end for
+
+	return peak
+# end estimate period
+
+
+
+##########
+# import #
+##########
+
+# import a WAV or CSV file (on the extension) as arbitrary waveform
+#	start: start of the part to use, in seconds
+#	duration: length of the part to use (one period), in seconds
+#	frequency: frequency of the signal (Hz): use one period, or "auto" to
+#		estimate it from the signal (using at most "analyse" samples)
+#		(default: duration, or the rest of the file for WAV files)
+#	taps: length of the resampling filter (zero crossings)
+#	cutoff: cut-off frequency of the resampling filter, relative to the
+#		Nyquist frequency
+#	span, dither: see quantise() in jds6600synth (default: full range)
+#	readerargs: passed to open_wav() or open_csv()
+# returns ImportedWave
+def import_wave(path,start=0.0,duration=None,frequency=None,taps=32,cutoff=0.9,span=None,dither=None,analyse=1<<20,**readerargs):
+	if (duration != None) and (frequency != None): raise ValueError("duration and frequency given")
+	if not (start >= 0): raise ValueError(start)
+	if not (0 < cutoff <= 1): raise ValueError(cutoff)
+
+	if path.lower().endswith(".wav"):
+		(samplerate,nsamples,chunks)=open_wav(path,**readerargs)
+	else:
+		(samplerate,nsamples,chunks)=open_csv(path,**readerargs)
+	# end else - if
+
+	try:
+		skip=int(round(start*samplerate))
+
+		if duration != None:
+			length=duration*samplerate
+		elif frequency == "auto":
+			length=None
+		elif frequency != None:
+			length=samplerate/frequency
+		elif nsamples != None:
+			length=nsamples-skip
+		else:
+			raise ValueError("duration or frequency needed")
+		# end elif - elif - ... - if
+
+		if (length != None) and not (length >= 2):
+			raise ValueError("less then 2 samples selected")
+		# end if
+
+		resampler=None if length == None else _Resampler(length,taps=taps,cutoff=cutoff)
+		buffered=[]
+		nbuffered=0
+
+		for x in chunks:
+			# skip up to "start"
+			if skip > 0:
+				n=min(skip,len(x))
+				skip -= n
+				x=x[n:]
+			# end if
+
+			if resampler == None:
+				# collect samples to estimate the period
+				buffered.append(x[:analyse-nbuffered])
+				nbuffered += len(buffered[-1])
+				if nbuffered < analyse:
+					continue
+				# end if
+
+				x=numpy.concatenate(buffered)
+				buffered=None
+				length=estimate_period(x)
+				resampler=_Resampler(length,taps=taps,cutoff=cutoff)
+			# end if
+
+			resampler.feed(x)
+			if resampler.done():
+				break
+			# end if
+		# end for
+
+		# end of the file while collecting samples to estimate the period
+		if resampler == None:
+			x=numpy.concatenate(buffered) if buffered else numpy.zeros(0)
+			length=estimate_period(x)
+			resampler=_Resampler(length,taps=taps,cutoff=cutoff)
+			resampler.feed(x)
+		# end if
+	finally:
+		chunks.close()
+	# end try
+
+	if not resampler.done():
+		raise ValueError("file too short for the selected part")
+	# end if
+
+	(samples,stats)=quantise(resampler.result(),span=span,dither=dither)
+	return ImportedWave(samples,stats,samplerate,int(round(start*samplerate)),length)
+# end import wave
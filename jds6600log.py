@@ -0,0 +1,550 @@
+# jds6600log.py
+# log of measured data of a JDS6600 signal generator, in a compact binary file
+
+# published under MIT license. See file "LICENSE" for full license text
+
+# MeasureLogWriter appends timestamped raw register values (the integers read
+# from the device, e.g. measure_stream(...,raw=True) or counter_getcounter())
+# to a log file; MeasureLogReader reads them back as numpy arrays, converted
+# to the units of the get-functions:
+#
+#	with MeasureLogWriter("run.log",("freq_f","dutycycle","counter")) as log:
+#		for sample in jds.measure_stream(("freq_f","dutycycle"),raw=True):
+#			log.append(sample.values+(jds.counter_getcounter(),),sample.time)
+#
+#	data = MeasureLogReader("run.log").read()
+#	data["time"], data["freq_f"] ...	# numpy arrays: seconds, Hz, ...
+#
+# File format (little endian):
+# - header: "<8sHHI" (magic "JDS6600L", version 1, 0, length of the json
+#	description that follows: {"fields": [...], "units": [...]}), padded to a
+#	multiple of 8 bytes
+# - blocks, each with a header "<4sIII": type, number of entries, length of
+#	the data, crc32 of the data
+#	- "JDSD": data block of n rows: columns "time" (microseconds) and the
+#		fields. Per column (starting with time): the size of the differences
+#		(1, 2, 4 or 8 bytes), padded to 8 bytes; the first value of every
+#		column (int64); and per column the n-1 differences between the values
+#		(padded to 8 bytes)
+#	- "JDSI": index block, after every "indexblocks" data blocks: per data
+#		block since the previous index "<qqqq" (offset, first row, first and
+#		last time), so a reader can find a time range without decoding data
+#
+# Rows are collected in memory and written as one block per "blockrows" rows,
+# or when "flushinterval" seconds have passed. A block is written with one
+# write, followed by fsync: after a crash, the file holds all blocks written
+# before, and possibly one incomplete block at the end that is ignored by the
+# reader (and removed when the file is opened again for writing). The reader
+# can be used while the log is being written: refresh() reads the blocks
+# written since.
+#
+# Note: the reader needs numpy
+
+
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+from jds6600 import jds6600
+
+
+# units of the register values: value = register / unit
+UNITS=dict((name,unit) for (name,(reg,unit)) in jds6600.MEASURE_DATA_SCALE.items())
+UNITS["counter"]=1
+
+_MAGIC=b"JDS6600L"
+_VERSION=1
+_HEADER=struct.Struct("<8sHHI")
+_BLOCK=struct.Struct("<4sIII")
+_INDEX=struct.Struct("<qqqq")
+_DATA=b"JDSD"
+_IDX=b"JDSI"
+
+# size of the differences -> array typecode / numpy dtype
+_TYPECODE={1:"b",2:"h",4:"i",8:"q"}
+_DTYPE={1:"<i1",2:"<i2",4:"<i4",8:"<i8"}
+
+
+# padding to a multiple of 8 bytes
+def _pad(n):
+	return -n%8
+# end pad
+
+
+# scan the blocks of a log file from "offset" up to "size": the data blocks
+# are added to "blocks" as [offset, rows, first row, first time, last time]
+# (the times are None for data blocks not in an index block yet)
+# returns (offset after the last complete block, number of rows)
+def _scan(buf,offset,size,firstrow,blocks):
+	while offset+_BLOCK.size <= size:
+		(kind,n,length,crc)=_BLOCK.unpack_from(buf,offset)
+		end=offset+_BLOCK.size+length
+
+		if ((kind != _DATA) and (kind != _IDX)) or (end > size):
+			# incomplete block at the end
+			break
+		# end if
+
+		if kind == _DATA:
+			blocks.append([offset,n,firstrow,None,None])
+			firstrow += n
+		else:
+			data=buf[offset+_BLOCK.size:end]
+			if zlib.crc32(data) != crc:
+				break
+			# end if
+
+			# the data blocks in the index are complete
+			byoffset={b[0]: b for b in blocks[-n:]}
+			for (boffset,brow,tfirst,tlast) in _INDEX.iter_unpack(data):
+				if boffset in byoffset:
+					byoffset[boffset][3:5]=[tfirst,tlast]
+				# end if
+			# end for
+		# end else - if
+
+		offset=end
+	# end while
+
+	return (offset,firstrow)
+# end scan
+
+
+
+##########################
+# MeasureLogWriter class #
+##########################
+
+class MeasureLogWriter:
+	'append-only log of timestamped register values'
+
+	# fields: names of the values of a row (see UNITS, other names get unit 1)
+	# An existing log is appended to: the fields must be the same.
+	def __init__(self,path,fields,blockrows=1024,flushinterval=1.0,indexblocks=64,fsync=True):
+		if (type(fields) != list) and (type(fields) != tuple): raise TypeError(fields)
+		if not fields: raise ValueError(fields)
+		for field in fields:
+			if type(field) != str: raise TypeError(field)
+			if field == "time": raise ValueError(field)
+		# end for
+		if type(blockrows) != int: raise TypeError(blockrows)
+		if not (blockrows >= 1): raise ValueError(blockrows)
+
+		self.path=path
+		self.fields=tuple(fields)
+		self.blockrows=blockrows
+		self.flushinterval=flushinterval
+		self.indexblocks=indexblocks
+		self.fsync=fsync
+
+		# rows not written yet, per column (time first)
+		self.__columns=[[] for c in range(len(fields)+1)]
+		self.__firstappend=None
+		# data blocks not in an index block yet: (offset, first row, first time, last time)
+		self.__unindexed=[]
+
+		if os.path.exists(path) and (os.path.getsize(path) > 0):
+			self.__f=open(path,"r+b")
+			try:
+				self.__recover()
+			except:
+				self.__f.close()
+				raise
+			# end try
+		else:
+			self.__f=open(path,"wb")
+			description=json.dumps({"fields": list(fields),"units": [UNITS.get(f,1) for f in fields]}).encode()
+			header=_HEADER.pack(_MAGIC,_VERSION,0,len(description))+description
+			self.__f.write(header+bytes(_pad(len(header))))
+			self.__sync()
+			self.rows=0
+		# end else - if
+	# end constructor
+
+
+	# open an existing log: check the fields, and remove an incomplete block
+	# at the end
+	def __recover(self):
+		reader=MeasureLogReader(self.path,_numpy=False)
+		try:
+			if reader.fields != self.fields:
+				errmsg="log has fields {}, not {}".format(reader.fields,self.fields)
+				raise ValueError(errmsg)
+			# end if
+
+			self.rows=reader.rows
+			end=reader.end
+
+			# data blocks after the last index block
+			for (offset,n,firstrow,tfirst,tlast) in reader.blocks:
+				if tfirst == None:
+					t=reader.blocktimes(offset)
+					self.__unindexed.append((offset,firstrow)+t)
+				# end if
+			# end for
+		finally:
+			reader.close()
+		# end try
+
+		self.__f.truncate(end)
+		self.__f.seek(end)
+		self.__sync()
+	# end recover
+
+
+	def __sync(self):
+		self.__f.flush()
+		if self.fsync == True:
+			os.fsync(self.__f.fileno())
+		# end if
+	# end sync
+
+
+	# append a row: the register values (integers) of the fields, and the
+	# time (as time.time(), default now). A MeasureSample of
+	# measure_stream(...,raw=True) can be given as row.
+	def append(self,values,timestamp=None):
+		if hasattr(values,"values") and hasattr(values,"time"):
+			if timestamp == None: timestamp=values.time
+			values=values.values
+		# end if
+
+		if len(values) != len(self.fields): raise ValueError(values)
+		for v in values:
+			if type(v) != int: raise TypeError(v)
+		# end for
+
+		if timestamp == None:
+			timestamp=time.time()
+		# end if
+
+		columns=self.__columns
+		columns[0].append(int(round(timestamp*1000000)))
+		for (column,v) in zip(columns[1:],values):
+			column.append(v)
+		# end for
+
+		now=time.monotonic()
+		if self.__firstappend == None:
+			self.__firstappend=now
+		# end if
+
+		if (len(columns[0]) >= self.blockrows) or ((self.flushinterval != None) and (now-self.__firstappend >= self.flushinterval)):
+			self.flush()
+		# end if
+	# end append
+
+
+	# write the rows collected as a data block
+	def flush(self):
+		columns=self.__columns
+		n=len(columns[0])
+		if n == 0:
+			return
+		# end if
+
+		widths=bytearray()
+		bases=array.array('q')
+		parts=[]
+		for column in columns:
+			deltas=[b-a for (a,b) in zip(column,column[1:])]
+
+			width=8
+			if deltas:
+				(low,high)=(min(deltas),max(deltas))
+				for w in (1,2,4):
+					if (-(1 << (8*w-1)) <= low) and (high < (1 << (8*w-1))):
+						width=w
+						break
+					# end if
+				# end for
+			# end if
+
+			a=array.array(_TYPECODE[width],deltas)
+			if sys.byteorder == "big":
+				a.byteswap()
+			# end if
+
+			widths.append(width)
+			bases.append(column[0])
+			parts.append(a.tobytes())
+		# end for
+
+		if sys.byteorder == "big":
+			bases.byteswap()
+		# end if
+
+		data=bytearray(widths)
+		data += bytes(_pad(len(data)))
+		data += bases.tobytes()
+		for part in parts:
+			data += part
+			data += bytes(_pad(len(part)))
+		# end for
+
+		offset=self.__f.tell()
+		self.__f.write(_BLOCK.pack(_DATA,n,len(data),zlib.crc32(data))+data)
+		self.__sync()
+
+		self.__unindexed.append((offset,self.rows,columns[0][0],columns[0][-1]))
+		self.rows += n
+		self.__columns=[[] for c in columns]
+		self.__firstappend=None
+
+		if len(self.__unindexed) >= self.indexblocks:
+			self.__writeindex()
+		# end if
+	# end flush
+
+
+	# write an index block for the data blocks since the previous one
+	def __writeindex(self):
+		if not self.__unindexed:
+			return
+		# end if
+
+		data=b"".join(_INDEX.pack(*entry) for entry in self.__unindexed)
+		self.__f.write(_BLOCK.pack(_IDX,len(self.__unindexed),len(data),zlib.crc32(data))+data)
+		self.__sync()
+
+		self.__unindexed=[]
+	# end write index
+
+
+	# write all rows and close the file
+	def close(self):
+		if self.__f.closed:
+			return
+		# end if
+
+		try:
+			self.flush()
+			self.__writeindex()
+		finally:
+			self.__f.close()
+		# end try
+	# end close
+
+	def __enter__(self):
+		return self
+	# end enter
+
+	def __exit__(self,exc_type,exc,tb):
+		self.close()
+	# end exit
+
+# end class MeasureLogWriter
+
+
+
+##########################
+# MeasureLogReader class #
+##########################
+
+class MeasureLogReader:
+	'read a log of MeasureLogWriter, also while it is being written'
+
+	def __init__(self,path,_numpy=True):
+		if _numpy == True:
+			import numpy
+			self.__numpy=numpy
+		# end if
+
+		self.path=path
+		self.__f=open(path,"rb")
+		self.__mm=None
+
+		try:
+			header=self.__f.read(_HEADER.size)
+			if len(header) != _HEADER.size:
+				raise ValueError("not a jds6600 measure log")
+			# end if
+
+			(magic,version,reserved,length)=_HEADER.unpack(header)
+			if magic != _MAGIC:
+				raise ValueError("not a jds6600 measure log")
+			# end if
+			if version != _VERSION:
+				errmsg="unsupported log version: "+str(version)
+				raise ValueError(errmsg)
+			# end if
+
+			description=json.loads(self.__f.read(length).decode())
+		except:
+			self.__f.close()
+			raise
+		# end try
+
+		self.fields=tuple(description["fields"])
+		self.units=tuple(description["units"])
+
+		# data blocks: [offset, rows, first row, first time, last time]
+		self.blocks=[]
+		self.rows=0
+		self.end=_HEADER.size+length+_pad(_HEADER.size+length)
+
+		self.refresh()
+	# end constructor
+
+
+	# read the blocks written since the log was opened (or refreshed)
+	def refresh(self):
+		size=os.fstat(self.__f.fileno()).st_size
+		if size <= self.end:
+			return
+		# end if
+
+		if self.__mm != None:
+			self.__mm.close()
+		# end if
+		self.__mm=mmap.mmap(self.__f.fileno(),size,access=mmap.ACCESS_READ)
+
+		(end,rows)=_scan(self.__mm,self.end,size,self.rows,self.blocks)
+
+		# data blocks not in an index: check them, and get their times
+		for (i,block) in enumerate(self.blocks):
+			if (block[0] >= self.end) and (block[3] == None):
+				if not self.__check(block[0]):
+					# incomplete block (at the end)
+					end=block[0]
+					rows=block[2]
+					del self.blocks[i:]
+					break
+				# end if
+			# end if
+		# end for
+
+		self.end=end
+		self.rows=rows
+	# end refresh
+
+
+	# check the crc of a block
+	def __check(self,offset):
+		(kind,n,length,crc)=_BLOCK.unpack_from(self.__mm,offset)
+		start=offset+_BLOCK.size
+		return zlib.crc32(self.__mm[start:start+length]) == crc
+	# end check
+
+
+	# decode a column of a data block: (base, size of the differences, offset
+	# of the differences, rows)
+	def __column(self,offset,column):
+		(kind,n,length,crc)=_BLOCK.unpack_from(self.__mm,offset)
+		ncols=len(self.fields)+1
+		start=offset+_BLOCK.size
+
+		widths=self.__mm[start:start+ncols]
+		pos=start+ncols+_pad(ncols)
+		base=struct.unpack_from("<q",self.__mm,pos+8*column)[0]
+		pos += 8*ncols
+
+		for c in range(column):
+			size=widths[c]*(n-1)
+			pos += size+_pad(size)
+		# end for
+
+		return (base,widths[column],pos,n)
+	# end column
+
+
+	# first and last time (microseconds) of a data block
+	def blocktimes(self,offset):
+		(base,width,pos,n)=self.__column(offset,0)
+
+		a=array.array(_TYPECODE[width])
+		a.frombytes(self.__mm[pos:pos+width*(n-1)])
+		if sys.byteorder == "big":
+			a.byteswap()
+		# end if
+
+		return (base,base+sum(a))
+	# end block times
+
+
+	# read the log as numpy arrays: dictionary "time" (seconds, as
+	# time.time()) and the fields (converted to units, or raw register
+	# values if "raw" is True)
+	#	fields: fields to read, default all
+	#	start, end: only rows from "start" up to "end" (seconds)
+	def read(self,fields=None,start=None,end=None,raw=False):
+		numpy=self.__numpy
+
+		if fields == None:
+			fields=self.fields
+		# end if
+		for field in fields:
+			if field not in self.fields: raise ValueError(field)
+		# end for
+
+		# blocks in the time range
+		blocks=[]
+		for block in self.blocks:
+			(tfirst,tlast)=block[3:5] if block[3] != None else self.blocktimes(block[0])
+
+			if ((start == None) or (tlast >= start*1000000)) and ((end == None) or (tfirst <= end*1000000)):
+				blocks.append(block)
+			# end if
+		# end for
+
+		columns=[0]+[self.fields.index(f)+1 for f in fields]
+		parts=[[] for c in columns]
+		for block in blocks:
+			if not self.__check(block[0]):
+				errmsg="corrupt block at offset "+str(block[0])
+				raise ValueError(errmsg)
+			# end if
+
+			for (i,c) in enumerate(columns):
+				(base,width,pos,n)=self.__column(block[0],c)
+
+				values=numpy.empty(n,dtype=numpy.int64)
+				values[0]=base
+				numpy.cumsum(numpy.frombuffer(self.__mm,dtype=_DTYPE[width],count=n-1,offset=pos),dtype=numpy.int64,out=values[1:])
+				if n > 1: values[1:] += base
+
+				parts[i].append(values)
+			# end for
+		# end for
+
+		data=[numpy.concatenate(p) if p else numpy.zeros(0,dtype=numpy.int64) for p in parts]
+
+		# rows in the time range
+		if (start != None) or (end != None):
+			mask=numpy.ones(len(data[0]),dtype=bool)
+			if start != None: mask &= data[0] >= start*1000000
+			if end != None: mask &= data[0] <= end*1000000
+			data=[d[mask] for d in data]
+		# end if
+
+		result={"time": data[0]/1000000}
+		for (field,c,d) in zip(fields,columns[1:],data[1:]):
+			result[field]=d if raw == True else d/self.units[c-1]
+		# end for
+
+		return result
+	# end read
+
+
+	def close(self):
+		if self.__mm != None:
+			self.__mm.close()
+			self.__mm=None
+		# end if
+		self.__f.close()
+	# end close
+
+	def __enter__(self):
+		return self
+	# end enter
+
+	def __exit__(self,exc_type,exc,tb):
+		self.close()
+	# end exit
+
+# end class MeasureLogReader
@@ -0,0 +1,172 @@
+# jds6600pool.py
+# remote-control a number of JDS6600 signal generators at the same time
+
+# published under MIT license. See file "LICENSE" for full license text
+
+# The DevicePool class drives a number of devices from one thread: the serial
+# ports of all devices are multiplexed on one (private) asyncio event loop,
+# using the AsyncJDS6600 class. A function called on the pool is executed on
+# all devices at the same time, so the total time is the time of the slowest
+# device, not the sum of all devices.
+#
+#	pool = DevicePool(["/dev/ttyUSB0","/dev/ttyUSB1"])
+#	pool.call("setfrequency",1,1000)	# same parameter on all devices
+#	freqs = pool.call("getfrequency",1)	# list: one value per device
+#	pool.call_each("setamplitude",[(1,1.0),(1,2.0)]) # one set of arguments per device
+#
+# From asyncio code, use acall() and acall_each() on the running event loop.
+
+
+import asyncio
+
+from jds6600async import AsyncJDS6600
+
+
+###########
+#  Errors #
+###########
+
+class PoolError(RuntimeError):
+	# called when a function failed on one or more devices
+	# results is a list with one element per device: the value returned, or
+	# the exception raised by that device
+	def __init__(self,results):
+		self.results=results
+		RuntimeError.__init__(self,[r for r in results if isinstance(r,BaseException)])
+	# end constructor
+
+
+####################
+# DevicePool class #
+####################
+
+class DevicePool:
+	'pool of jds6600 devices, driven at the same time'
+
+	def __init__(self,ports,timeout=1):
+		if (type(ports) != list) and (type(ports) != tuple): raise TypeError(ports)
+		for port in ports:
+			if type(port) != str: raise TypeError(port)
+		# end for
+
+		self.ports=list(ports)
+		self.devices=[]
+		self.__loop=None
+
+		try:
+			for port in self.ports:
+				self.devices.append(AsyncJDS6600(port,timeout))
+			# end for
+		except:
+			self.close()
+			raise
+		# end try
+	# end constructor
+
+
+	# close all serial ports
+	def close(self):
+		for dev in self.devices:
+			dev.close()
+		# end for
+		self.devices=[]
+
+		if self.__loop != None:
+			self.__loop.close()
+			self.__loop=None
+		# end if
+	# end close
+
+	def __enter__(self):
+		return self
+	# end enter
+
+	def __exit__(self,exc_type,exc,tb):
+		self.close()
+	# end exit
+
+	def __len__(self):
+		return len(self.devices)
+	# end len
+
+
+	#####
+	# async API
+
+	# check the name of the function to call
+	def __function(self,function):
+		if type(function) != str: raise TypeError(function)
+
+		if function.startswith("_") or not callable(getattr(AsyncJDS6600,function,None)):
+			errmsg="Unknown function: "+function
+			raise ValueError(errmsg)
+		# end if
+	# end function
+
+	async def __gather(self,calls,timeout,return_exceptions):
+		if timeout != None:
+			calls=[asyncio.wait_for(c,timeout) for c in calls]
+		# end if
+
+		results=await asyncio.gather(*calls,return_exceptions=True)
+
+		if (return_exceptions == False) and [r for r in results if isinstance(r,BaseException)]:
+			raise PoolError(results)
+		# end if
+
+		return results
+	# end gather
+
+
+	# call a function with the same arguments on all devices
+	# returns a list with the result of every device
+	async def acall(self,function,*args,timeout=None,return_exceptions=False,**kwargs):
+		self.__function(function)
+
+		calls=[getattr(dev,function)(*args,**kwargs) for dev in self.devices]
+		return await self.__gather(calls,timeout,return_exceptions)
+	# end acall
+
+
+	# call a function on all devices, with one set of arguments (a tuple) per device
+	# returns a list with the result of every device
+	async def acall_each(self,function,argslist,timeout=None,return_exceptions=False):
+		self.__function(function)
+
+		if len(argslist) != len(self.devices):
+			errmsg="{} sets of arguments for {} devices".format(len(argslist),len(self.devices))
+			raise ValueError(errmsg)
+		# end if
+
+		calls=[]
+		for (dev,args) in zip(self.devices,argslist):
+			if type(args) != tuple: args=(args,)
+			calls.append(getattr(dev,function)(*args))
+		# end for
+
+		return await self.__gather(calls,timeout,return_exceptions)
+	# end acall each
+
+
+	#####
+	# blocking API: runs the async API on the private event loop of the pool
+
+	def __run(self,coroutine):
+		if self.__loop == None:
+			self.__loop=asyncio.new_event_loop()
+		# end if
+
+		return self.__loop.run_until_complete(coroutine)
+	# end run
+
+	# call a function with the same arguments on all devices
+	def call(self,function,*args,timeout=None,return_exceptions=False,**kwargs):
+		return self.__run(self.acall(function,*args,timeout=timeout,return_exceptions=return_exceptions,**kwargs))
+	# end call
+
+	# call a function on all devices, with one set of arguments per device
+	def call_each(self,function,argslist,timeout=None,return_exceptions=False):
+		return self.__run(self.acall_each(function,argslist,timeout=timeout,return_exceptions=return_exceptions))
+	# end call each
+
+# end class DevicePool
@@ -0,0 +1,531 @@
+# jds6600sim.py
+# simulator of a JDS6600 signal generator on a pseudo-terminal
+
+# published under MIT license. See file "LICENSE" for full license text
+
+# The simulator opens a pseudo-terminal and speaks the same line protocol as
+# the device (see registers.txt):
+#	:rNN=n.		read n+1 registers, starting at register NN
+#	:wNN=v.		write register NN
+#	:bNN=0.		read arbitrary waveform NN
+#	:aNN=v,v,...	write arbitrary waveform NN
+#
+# It can be used as a device by the jds6600 class:
+#	sim = JDS6600Simulator(latency=0.005)
+#	sim.start()
+#	j = jds6600(sim.port)
+#
+# Modeled:
+# - the register map of registers.txt, including the system registers that
+#	are read one register higher then they are written (quirk=True)
+# - mode (register 33: written as mode-id, read as mode-id * 8 / 16) and action
+# - 60 arbitrary waveforms of 2048 points
+# - profiles save / load / clear
+# - counter (register 80) and measure (registers 81 to 89) data, as if
+#	channel 1 is connected to EXT.IN. Measured values are updated once per
+#	gate time.
+#
+# Performance model and fault injection:
+#	latency:	delay before the device replies to a command, in seconds
+#	baudrate:	speed of the serial line, used to delay commands and replies
+#				according to their size (None: no delay)
+#	drop:		probability that a command does not get a reply
+#	garbage:	probability that a reply is replaced by a line of random bytes
+#	stall:		probability that a reply is delayed by "stalltime" seconds
+
+
+import collections
+import math
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+
+# mode-id (write) -> register value (read)
+_MODEREAD={0:0,1:16,2:32,4:64,5:72,6:80,7:88,8:96,9:104}
+
+# frequency multipliers (see registers.txt)
+_FREQMULTIPLY=(1,1,1,1/1000,1/1000000)
+
+
+# default register values, all registers are stored as a list of integers
+_DEFAULTREGS={
+	0: [60],		# model: 60 MHz
+	1: [1234567890],	# serial number
+	20: [1,1],		# channel enable
+	21: [0],		# waveform ch1: sine
+	22: [0],		# waveform ch2: sine
+	23: [100000,0],	# frequency ch1: 1 KHz
+	24: [100000,0],	# frequency ch2: 1 KHz
+	25: [5000],		# amplitude ch1: 5 V
+	26: [5000],		# amplitude ch2: 5 V
+	27: [1000],		# offset ch1: 0 V
+	28: [1000],		# offset ch2: 0 V
+	29: [500],		# dutycycle ch1: 50 %
+	30: [500],		# dutycycle ch2: 50 %
+	31: [0],		# phase
+	32: [0,0,0,0],	# action: stop
+	33: [0],		# mode: WAVE_CH1
+	34: [0],
+	35: [0],
+	36: [0],		# measure coupling: AC
+	37: [100],		# measure gate time: 1 s
+	38: [0],		# measure mode: M.FREQ
+	39: [0],
+	40: [100],		# sweep start freq: 1 Hz
+	41: [100000],	# sweep end freq: 1 KHz
+	42: [100],		# sweep time: 10 s
+	43: [0],		# sweep direction: RISE
+	44: [0],		# sweep mode: LINEAR
+	45: [1000,0],	# pulse width: 1000 ns
+	46: [10000,0],	# pulse period: 10000 ns
+	47: [0],		# pulse offset
+	48: [500],		# pulse amplitude: 5 V
+	49: [1],		# burst number
+	50: [0],		# burst mode: MANUAL TRIG.
+}
+
+# system parameters, in order of their write register (51 to 55):
+# sound, brightness, language, sync, arbmaxnum
+_DEFAULTSYSTEM=([1],[12],[0],[0,0,0,0,0],[60])
+
+# registers saved in a profile
+_PROFILEREGS=tuple(range(20,32))+tuple(range(36,51))
+
+
+class JDS6600Simulator:
+	'jds6600 simulator on a pseudo-terminal'
+
+	def __init__(self,latency=0,baudrate=None,drop=0,garbage=0,stall=0,stalltime=2,quirk=True,seed=None):
+		for p in (latency,drop,garbage,stall,stalltime):
+			if (type(p) != int) and (type(p) != float): raise TypeError(p)
+			if p < 0: raise ValueError(p)
+		# end for
+
+		for p in (drop,garbage,stall):
+			if p > 1: raise ValueError(p)
+		# end for
+
+		if (baudrate != None) and (type(baudrate) != int): raise TypeError(baudrate)
+		if type(quirk) != bool: raise TypeError(quirk)
+
+		self.latency=latency
+		self.baudrate=baudrate
+		self.drop=drop
+		self.garbage=garbage
+		self.stall=stall
+		self.stalltime=stalltime
+		self.quirk=quirk
+
+		self.__random=random.Random(seed)
+
+		# registers
+		self.regs={reg: list(value) for (reg,value) in _DEFAULTREGS.items()}
+		self.system=[list(value) for value in _DEFAULTSYSTEM]
+
+		# arbitrary waveforms 1 to 60: one period of a sine
+		sine=[int(round(2047.5+2047.5*math.sin(2*math.pi*i/2048))) for i in range(2048)]
+		self.arb={waveid: list(sine) for waveid in range(1,61)}
+
+		self.profiles={}
+
+		# counter and measure data
+		self.__counter=0
+		self.__counterstart=None
+		self.__measure=[0]*9
+		self.__gatestart=time.monotonic()
+
+		# number of commands received, per command ("r", "w", "b", "a")
+		self.commands=collections.Counter()
+
+		self.port=None
+		self.__master=None
+		self.__slave=None
+		self.__thread=None
+		self.__stop=None
+		self.__lock=threading.Lock()
+	# end constructor
+
+
+	#####
+	# start / stop
+
+	# open the pseudo-terminal and start serving, returns the port name
+	def start(self):
+		if self.__thread != None:
+			raise RuntimeError("simulator already started")
+		# end if
+
+		(self.__master,self.__slave)=os.openpty()
+		tty.setraw(self.__slave)
+		self.port=os.ttyname(self.__slave)
+
+		self.__stop=os.pipe()
+		self.__thread=threading.Thread(target=self.__serve,name="jds6600sim",daemon=True)
+		self.__thread.start()
+
+		return self.port
+	# end start
+
+
+	# stop serving and close the pseudo-terminal
+	def stop(self):
+		if self.__thread == None:
+			return
+		# end if
+
+		os.write(self.__stop[1],b'x')
+		self.__thread.join()
+		self.__thread=None
+
+		for fd in (self.__master,self.__slave)+self.__stop:
+			os.close(fd)
+		# end for
+	# end stop
+
+	def __enter__(self):
+		self.start()
+		return self
+	# end enter
+
+	def __exit__(self,exc_type,exc,tb):
+		self.stop()
+	# end exit
+
+
+	#####
+	# serial line
+
+	def __serve(self):
+		buf=bytearray()
+
+		# time the serial line is free again, for received and send data
+		self.__rxfree=0
+		self.__txfree=0
+
+		while True:
+			(readable,w,x)=select.select([self.__master,self.__stop[0]],[],[])
+			if self.__stop[0] in readable:
+				return
+			# end if
+
+			try:
+				data=os.read(self.__master,65536)
+			except OSError:
+				return
+			# end try
+
+			buf += data
+			now=time.monotonic()
+
+			while True:
+				i=buf.find(b'\n')
+				if i < 0:
+					break
+				# end if
+
+				line=bytes(buf[:i+1])
+				del buf[:i+1]
+
+				# time the command has been received completely
+				received=max(now,self.__rxfree)+self.__transfertime(len(line))
+				self.__rxfree=received
+
+				reply=self.command(line)
+				if reply != None:
+					self.__reply(line,reply,received)
+				# end if
+			# end while
+		# end while
+	# end serve
+
+
+	# transfer time of data on the serial line (10 bits per byte)
+	def __transfertime(self,nbytes):
+		if self.baudrate == None:
+			return 0
+		# end if
+
+		return nbytes*10/self.baudrate
+	# end transfertime
+
+
+	# send a reply, applying the performance model and fault injection
+	def __reply(self,command,reply,received):
+		r=self.__random.random()
+
+		if r < self.drop:
+			return
+		# end if
+		r -= self.drop
+
+		if r < self.garbage:
+			reply=bytes(self.__random.randrange(32,127) for i in range(self.__random.randrange(1,40)))+b'\r\n'
+		# end if
+		r -= self.garbage
+
+		# the command has been received completely at "received"
+		# the reply can only start when the previous reply has been send
+		start=received+self.latency
+		if r < self.stall:
+			start += self.stalltime
+		# end if
+		start=max(start,self.__txfree)
+		self.__txfree=start+self.__transfertime(len(reply))
+
+		# send the reply in blocks, at the speed of the serial line
+		view=memoryview(reply)
+		pos=0
+		while pos < len(view):
+			block=view[pos:pos+256]
+			pos += len(block)
+
+			wait=start+self.__transfertime(pos)-time.monotonic()
+			if wait > 0:
+				time.sleep(wait)
+			# end if
+
+			os.write(self.__master,block)
+		# end while
+	# end reply
+
+
+	#####
+	# protocol
+
+	# execute one command line, returns the reply (bytes), or None if the
+	# command is not understood
+	def command(self,line):
+		try:
+			line=line.decode("ascii").strip()
+			cmd=line[1]
+			reg=int(line[2:4])
+			value=line[5:]
+		except (UnicodeDecodeError,IndexError,ValueError):
+			return None
+		# end try
+
+		if (line[0] != ":") or (line[4] != "="):
+			return None
+		# end if
+
+		# all commands end with a "."
+		if value.endswith("."):
+			value=value[:-1]
+		# end if
+
+		self.commands[cmd] += 1
+
+		with self.__lock:
+			try:
+				if cmd == "r":
+					return self.__read(reg,int(value)+1)
+				elif cmd == "w":
+					self.__write(reg,[int(v) for v in value.split(",")])
+					return b':ok\r\n'
+				elif cmd == "b":
+					return self.__arbread(reg)
+				elif cmd == "a":
+					self.__arbwrite(reg,[int(v) for v in value.split(",") if v != ""])
+					return b':ok\r\n'
+				# end elif - if
+			except ValueError:
+				return b':err\r\n'
+			# end try
+		# end with
+
+		return None
+	# end command
+
+
+	# read "n" registers starting at "reg"
+	def __read(self,reg,n):
+		now=time.monotonic()
+
+		lines=[]
+		for r in range(reg,reg+n):
+			value=",".join(str(v) for v in self.__getreg(r,now))
+			lines.append(":r{:02d}={}.\r\n".format(r,value))
+		# end for
+
+		return "".join(lines).encode("ascii")
+	# end read
+
+
+	def __getreg(self,reg,now):
+		if 51 <= reg <= 56:
+			# system parameters
+			i=reg-52 if self.quirk == True else reg-51
+			return self.system[i] if 0 <= i < 5 else [0]
+		# end if
+
+		if reg == 80:
+			return [self.__getcounter(now)]
+		# end if
+
+		if 81 <= reg <= 89:
+			self.__updatemeasure(now)
+			return [self.__measure[reg-81]]
+		# end if
+
+		return self.regs.get(reg,[0])
+	# end getreg
+
+
+	def __write(self,reg,value):
+		if reg == 33:
+			# mode: written as mode-id, read as in the "modes" table
+			if value[0] not in _MODEREAD:
+				raise ValueError(value)
+			# end if
+
+			self.regs[33]=[_MODEREAD[value[0]]]
+		elif reg == 32:
+			# action
+			if (value == [1,0,0,0]) and (self.regs[32] != [1,0,0,0]):
+				# start counting
+				self.__counterstart=time.monotonic()
+			elif (value != [1,0,0,0]) and (self.__counterstart != None):
+				# stop counting
+				self.__counter=self.__getcounter(time.monotonic())
+				self.__counterstart=None
+			# end elif - if
+
+			self.regs[32]=value
+		elif reg == 39:
+			# reset counter
+			self.__counter=0
+			if self.__counterstart != None:
+				self.__counterstart=time.monotonic()
+			# end if
+		elif 51 <= reg <= 55:
+			self.system[reg-51]=value
+		elif reg == 70:
+			self.profiles[value[0]]={r: list(self.regs[r]) for r in _PROFILEREGS}
+		elif reg == 71:
+			for (r,v) in self.profiles.get(value[0],{}).items():
+				self.regs[r]=list(v)
+			# end for
+		elif reg == 72:
+			self.profiles.pop(value[0],None)
+		else:
+			self.regs[reg]=value
+		# end else - elif - if
+	# end write
+
+
+	def __arbread(self,waveid):
+		if waveid not in self.arb:
+			raise ValueError(waveid)
+		# end if
+
+		# all values are followed by a ",", there is no terminating "."
+		data="".join(str(v)+"," for v in self.arb[waveid])
+		return ":b{:02d}={}\r\n".format(waveid,data).encode("ascii")
+	# end arbread
+
+
+	def __arbwrite(self,waveid,wave):
+		if (waveid not in self.arb) or (len(wave) != 2048):
+			raise ValueError(waveid)
+		# end if
+
+		for v in wave:
+			if not (0 <= v <= 4095):
+				raise ValueError(v)
+			# end if
+		# end for
+
+		self.arb[waveid]=wave
+	# end arbwrite
+
+
+	#####
+	# counter and measure model (channel 1 connected to EXT.IN)
+
+	# frequency of channel 1 in Hz, 0 if disabled
+	def __ch1freq(self):
+		if self.regs[20][0] == 0:
+			return 0
+		# end if
+
+		(f,multiplier)=self.regs[23]
+		return f/100*_FREQMULTIPLY[multiplier]
+	# end ch1freq
+
+
+	def __getcounter(self,now):
+		if self.__counterstart == None:
+			return self.__counter
+		# end if
+
+		return self.__counter+int(self.__ch1freq()*(now-self.__counterstart))
+	# end getcounter
+
+
+	# the measured values change once per gate time
+	def __updatemeasure(self,now):
+		gate=max(self.regs[37][0],1)/100
+
+		if now-self.__gatestart < gate:
+			return
+		# end if
+
+		self.__gatestart += gate*int((now-self.__gatestart)/gate)
+
+		f=self.__ch1freq()
+		if f <= 0:
+			self.__measure=[0]*9
+			return
+		# end if
+
+		duty=self.regs[29][0]/1000
+		period=1e8/f # unit: 0.01 us
+
+		self.__measure=[
+			int(round(f*10)),			# 81: freq (0.1 Hz)
+			int(round(f*1000)),			# 82: freq (0.001 Hz)
+			int(round(period*duty)),		# 83: pw+ (0.01 us)
+			int(round(period*(1-duty))),	# 84: pw- (0.01 us)
+			int(round(period)),			# 85: period (0.01 us)
+			int(round(duty*1000)),		# 86: dutycycle (0.1 %)
+			int(round(f*gate)),			# 87: unknown 1: pulses in gate time
+			int(round(period)),			# 88: unknown 2
+			int(round(period)) ]			# 89: unknown 3
+	# end updatemeasure
+
+# end class JDS6600Simulator
+
+
+
+if __name__ == '__main__':
+	import click
+
+	@click.command(help="Run a jds6600 simulator on a pseudo-terminal")
+	@click.option("--latency", type=float, default=0.0, help="reply latency (s)")
+	@click.option("--baudrate", type=int, default=None, help="serial line speed, for transfer time")
+	@click.option("--drop", type=float, default=0.0, help="probability of a dropped reply")
+	@click.option("--garbage", type=float, default=0.0, help="probability of a garbage reply")
+	@click.option("--stall", type=float, default=0.0, help="probability of a stalled reply")
+	@click.option("--stalltime", type=float, default=2.0, help="stall time (s)")
+	@click.option("--seed", type=int, default=None, help="random seed for fault injection")
+	def main(latency,baudrate,drop,garbage,stall,stalltime,seed):
+		sim=JDS6600Simulator(latency=latency,baudrate=baudrate,drop=drop,garbage=garbage,stall=stall,stalltime=stalltime,seed=seed)
+		print(sim.start(),flush=True)
+
+		try:
+			while True:
+				time.sleep(1)
+			# end while
+		except KeyboardInterrupt:
+			pass
+		# end try
+
+		sim.stop()
+	# end main
+
+	main()
+# end if
@@ -0,0 +1,348 @@
+# jds6600stats.py
+# statistics over long runs of measurements of a JDS6600 signal generator
+
+# published under MIT license. See file "LICENSE" for full license text
+
+# All statistics are calculated incrementally: every value is handled once,
+# in constant time, and the memory used does not grow with the length of the
+# run, so hours-long runs do not need to keep every value.
+#
+#	stats = MeasureStats(("freq_f","dutycycle"))
+#	for sample in jds.measure_stream(("freq_f","dutycycle")):
+#		stats.add(sample)
+#	...
+#	print(stats.summary()["freq_f"])
+#
+# - RunningStats: number, mean, standard deviation (Welford), minimum and
+#	maximum, and percentiles
+# - P2Quantile: approximate percentile, using the P-square algorithm (Jain and
+#	Chlamtac, 1985): 5 markers per percentile
+# - AllanDeviation: overlapping Allan deviation at a number of averaging times
+#	(default: 1, 2, 4, ... samples), using a ring buffer of the last
+#	2 * (largest averaging time) phase values
+
+
+import array
+import collections
+import math
+
+
+# summary of one field of MeasureStats.summary()
+#	n, mean, std, min, max: see RunningStats
+#	percentiles: dictionary percentile (0 - 1) -> value
+#	adev: list of (tau (s), allan deviation, number of terms), see
+#		AllanDeviation
+FieldSummary=collections.namedtuple("FieldSummary",("n","mean","std","min","max","percentiles","adev"))
+
+
+####################
+# P2Quantile class #
+####################
+
+class P2Quantile:
+	'approximate percentile of a stream of values (P-square algorithm)'
+
+	def __init__(self,p):
+		if (type(p) != int) and (type(p) != float): raise TypeError(p)
+		if not (0 < p < 1): raise ValueError(p)
+
+		self.p=p
+		self.n=0
+
+		# marker heights, positions (1 to n) and desired positions
+		self.__q=[]
+		self.__pos=[1,2,3,4,5]
+		self.__want=[1,1+2*p,1+4*p,3+2*p,5]
+		self.__step=(0,p/2,p,(1+p)/2,1)
+	# end constructor
+
+
+	# add a value
+	def add(self,x):
+		q=self.__q
+		pos=self.__pos
+		self.n += 1
+
+		# the first 5 values are the initial markers
+		if self.n <= 5:
+			q.append(x)
+			if self.n == 5: q.sort()
+			return
+		# end if
+
+		# cell of the value, update the extreme markers
+		if x < q[0]:
+			q[0]=x
+			k=0
+		elif x >= q[4]:
+			q[4]=x
+			k=3
+		else:
+			k=0
+			while x >= q[k+1]:
+				k += 1
+			# end while
+		# end else - elif - if
+
+		for i in range(k+1,5):
+			pos[i] += 1
+		# end for
+		for i in range(5):
+			self.__want[i] += self.__step[i]
+		# end for
+
+		# move the middle markers to their desired positions
+		for i in (1,2,3):
+			d=self.__want[i]-pos[i]
+
+			if ((d >= 1) and (pos[i+1]-pos[i] > 1)) or ((d <= -1) and (pos[i-1]-pos[i] < -1)):
+				d=1 if d > 0 else -1
+
+				# piecewise-parabolic prediction, linear if out of order
+				h=q[i]+d/(pos[i+1]-pos[i-1])*((pos[i]-pos[i-1]+d)*(q[i+1]-q[i])/(pos[i+1]-pos[i])+(pos[i+1]-pos[i]-d)*(q[i]-q[i-1])/(pos[i]-pos[i-1]))
+				if not (q[i-1] < h < q[i+1]):
+					h=q[i]+d*(q[i+d]-q[i])/(pos[i+d]-pos[i])
+				# end if
+
+				q[i]=h
+				pos[i] += d
+			# end if
+		# end for
+	# end add
+
+
+	# the estimated percentile, None if no values
+	def value(self):
+		if self.n == 0:
+			return None
+		# end if
+
+		if self.n < 5:
+			# exact: nearest rank of the values so far
+			values=sorted(self.__q)
+			return values[min(int(self.p*self.n),self.n-1)]
+		# end if
+
+		return self.__q[2]
+	# end value
+
+# end class P2Quantile
+
+
+
+######################
+# RunningStats class #
+######################
+
+class RunningStats:
+	'number, mean, standard deviation, minimum, maximum and percentiles of a stream of values'
+
+	def __init__(self,percentiles=(0.01,0.5,0.99)):
+		self.n=0
+		self.mean=0.0
+		self.min=None
+		self.max=None
+		self.__m2=0.0
+		self.__quantiles=[P2Quantile(p) for p in percentiles]
+	# end constructor
+
+
+	# add a value
+	def add(self,x):
+		self.n += 1
+
+		# Welford
+		delta=x-self.mean
+		self.mean += delta/self.n
+		self.__m2 += delta*(x-self.mean)
+
+		if self.n == 1:
+			self.min=x
+			self.max=x
+		elif x < self.min:
+			self.min=x
+		elif x > self.max:
+			self.max=x
+		# end elif - elif - if
+
+		for quantile in self.__quantiles:
+			quantile.add(x)
+		# end for
+	# end add
+
+
+	# sample variance and standard deviation (0 for less then 2 values)
+	def variance(self):
+		return self.__m2/(self.n-1) if self.n > 1 else 0.0
+	# end variance
+
+	def std(self):
+		return math.sqrt(self.variance())
+	# end std
+
+
+	# percentiles: dictionary percentile -> (approximate) value
+	def percentiles(self):
+		return {quantile.p: quantile.value() for quantile in self.__quantiles}
+	# end percentiles
+
+# end class RunningStats
+
+
+
+########################
+# AllanDeviation class #
+########################
+
+class AllanDeviation:
+	'overlapping Allan deviation of a stream of equally spaced values'
+
+	# The values are integrated into phase: x(0) = 0, x(i+1) = x(i) + y(i) - y(0)
+	# (the first value is subtracted to keep the phase small). For an averaging
+	# time of m samples, every new phase value adds one term:
+	#	(x(i) - 2*x(i-m) + x(i-2*m))^2
+	# and adev = sqrt(sum / (2 * m^2 * number of terms)), in the unit of the
+	# values. Divide by the nominal value for the fractional deviation.
+
+	# taus: averaging times in samples (default: 1, 2, 4, ... up to maxtau)
+	def __init__(self,taus=None,maxtau=1024):
+		if taus == None:
+			taus=[]
+			m=1
+			while m <= maxtau:
+				taus.append(m)
+				m *= 2
+			# end while
+		# end if
+
+		taus=sorted(set(taus))
+		if not taus: raise ValueError(taus)
+		for m in taus:
+			if type(m) != int: raise TypeError(m)
+			if not (m >= 1): raise ValueError(m)
+		# end for
+
+		self.taus=taus
+		self.n=0
+		self.__sums=[0.0]*len(taus)
+		self.__terms=[0]*len(taus)
+
+		# ring buffer of the last 2*max(taus)+1 phase values
+		self.__ringsize=2*taus[-1]+1
+		self.__ring=array.array('d',bytes(8*self.__ringsize))
+		self.__phase=0.0
+		self.__ref=None
+	# end constructor
+
+
+	# add a value
+	def add(self,y):
+		if self.__ref == None:
+			self.__ref=y
+		# end if
+
+		ring=self.__ring
+		size=self.__ringsize
+
+		# phase value number "n" (phase value 0 is 0)
+		self.__phase += y-self.__ref
+		self.n += 1
+		n=self.n
+		ring[n%size]=self.__phase
+
+		x=self.__phase
+		for (i,m) in enumerate(self.taus):
+			if n < 2*m:
+				break
+			# end if
+
+			d=x-2*ring[(n-m)%size]+ring[(n-2*m)%size]
+			self.__sums[i] += d*d
+			self.__terms[i] += 1
+		# end for
+	# end add
+
+
+	# the allan deviation: list of (tau, adev, number of terms), for the
+	# averaging times with at least one term
+	#	tau0: time between two values (tau is in samples if 1)
+	def adev(self,tau0=1):
+		result=[]
+		for (i,m) in enumerate(self.taus):
+			if self.__terms[i] == 0:
+				break
+			# end if
+
+			result.append((m*tau0,math.sqrt(self.__sums[i]/(2*m*m*self.__terms[i])),self.__terms[i]))
+		# end for
+
+		return result
+	# end adev
+
+# end class AllanDeviation
+
+
+
+######################
+# MeasureStats class #
+######################
+
+class MeasureStats:
+	'statistics of a number of fields of measure_stream() records'
+
+	# fields: names of the values of the records (as asked to measure_stream)
+	# adev: fields to calculate the allan deviation for (default: all)
+	# tau0: time between two records, default the average time between the
+	#	records added
+	def __init__(self,fields,percentiles=(0.01,0.5,0.99),adev=None,taus=None,maxtau=1024,tau0=None):
+		if (type(fields) != list) and (type(fields) != tuple): raise TypeError(fields)
+		if adev == None: adev=fields
+
+		for field in adev:
+			if field not in fields: raise ValueError(field)
+		# end for
+
+		self.fields=tuple(fields)
+		self.tau0=tau0
+		self.stats=[RunningStats(percentiles) for field in fields]
+		self.adev=[AllanDeviation(taus,maxtau) if field in adev else None for field in fields]
+
+		self.__first=None
+		self.__last=None
+	# end constructor
+
+
+	# add a record: a MeasureSample (time, values), or a tuple of values
+	def add(self,record):
+		if hasattr(record,"values") and hasattr(record,"time"):
+			if self.__first == None: self.__first=record.time
+			self.__last=record.time
+			record=record.values
+		# end if
+
+		if len(record) != len(self.fields): raise ValueError(record)
+
+		for (value,stats,adev) in zip(record,self.stats,self.adev):
+			stats.add(value)
+			if adev != None: adev.add(value)
+		# end for
+	# end add
+
+
+	# summary: dictionary field -> FieldSummary
+	def summary(self):
+		n=self.stats[0].n
+		tau0=self.tau0
+		if tau0 == None:
+			tau0=(self.__last-self.__first)/(n-1) if (self.__first != None) and (n > 1) else 1
+		# end if
+
+		result=collections.OrderedDict()
+		for (field,stats,adev) in zip(self.fields,self.stats,self.adev):
+			result[field]=FieldSummary(stats.n,stats.mean,stats.std(),stats.min,stats.max,stats.percentiles(),adev.adev(tau0) if adev != None else None)
+		# end for
+
+		return result
+	# end summary
+
+# end class MeasureStats
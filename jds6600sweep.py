@@ -0,0 +1,293 @@
+# jds6600sweep.py
+# host-driven frequency sweeps with a JDS6600 signal generator
+
+# published under MIT license. See file "LICENSE" for full license text
+
+# The sweep mode of the device only sweeps linearly or logarithmically between
+# two frequencies. list_sweep() sweeps along any list of frequencies, with a
+# dwell time per step, by writing the frequency register of a channel from
+# the host:
+#
+#	report = list_sweep(jds,1,[(1000,0.01),(2000,0.01),(1500,0.02)])
+#	report = list_sweep(jds,1,numpy.geomspace(10,1e6,1000000),dwell=0.001)
+#
+# The schedule is read step by step, so generators and large numpy arrays
+# can be used without building a list. The steps are timed from the start of
+# the sweep (a late step does not delay the steps after it), waiting with
+# sleep() and a short busy-wait at the end for accuracy. A dwell time of 0
+# sweeps at the highest rate the serial link allows.
+#
+# The writes are pipelined and the mode-check done by setfrequency() is
+# answered by the register shadow, so a step is one write command on the
+# serial line. Both are enabled during the sweep and restored afterwards.
+#
+# verified_sweep() steps channel 1 through a list of frequencies and checks
+# every step with the frequency measured on EXT.IN (channel 1 connected to
+# EXT.IN, device in "measure" mode). It is a generator: every step is given
+# as soon as it is measured:
+#
+#	for step in verified_sweep(jds,range(1000,2000,10),tolerance=0.5):
+#		print(step.target,step.measured,step.ok)
+#
+# The measured value changes once per gate time. After a frequency is set,
+# the measured values are polled (freq_f and freq_p, in one query): the first
+# result that changes is of the gate period the write came in, and is
+# skipped; the next result is of the first gate period that started after
+# the write. The next frequency is set right away, so a step takes about two
+# gate times.
+
+import collections
+import math
+import time
+
+from jds6600 import WrongMode
+
+
+# result of a sweep (times in seconds)
+#	steps: number of steps done
+#	elapsed: time from the first to the last step
+#	rate: steps per second
+#	late_mean, late_std, late_max: time a step was send after it was due
+#	jitter: standard deviation of the time between two steps, compared to
+#		the dwell time
+#	overruns: number of steps send after the next step was already due
+#		(steps with a dwell time of 0 are not counted)
+SweepReport=collections.namedtuple("SweepReport",("steps","elapsed","rate","late_mean","late_std","late_max","jitter","overruns"))
+
+# result of one step of a verified sweep
+#	target: frequency set (Hz)
+#	measured: frequency measured (Hz), in the measure mode of the device
+#		(M.FREQ: resolution 0.1 Hz, M.PERIOD: 0.001 Hz)
+#	ok: measured frequency within the tolerance, None if no tolerance given
+VerifiedStep=collections.namedtuple("VerifiedStep",("target","measured","ok"))
+
+
+# running mean and variance (Welford)
+class _Running:
+	__slots__=("n","mean","m2","max")
+
+	def __init__(self):
+		self.n=0
+		self.mean=0.0
+		self.m2=0.0
+		self.max=0.0
+	# end constructor
+
+	def add(self,x):
+		self.n += 1
+		delta=x-self.mean
+		self.mean += delta/self.n
+		self.m2 += delta*(x-self.mean)
+		if x > self.max: self.max=x
+	# end add
+
+	def std(self):
+		return math.sqrt(self.m2/(self.n-1)) if self.n > 1 else 0.0
+	# end std
+
+# end class _Running
+
+
+
+# wait until "due" (time.perf_counter() time): sleep, and busy-wait the last
+# "spin" seconds
+def _waituntil(due,spin):
+	wait=due-time.perf_counter()
+
+	if wait > spin:
+		time.sleep(wait-spin)
+	# end if
+
+	while time.perf_counter() < due:
+		pass
+	# end while
+# end wait until
+
+
+# the steps of a schedule: (frequency, dwell) pairs
+def _steps(schedule,dwell):
+	if dwell == None:
+		# (frequency, dwell) pairs, or an array of 2 columns
+		for (freq,d) in schedule:
+			yield (float(freq),float(d))
+		# end for
+
+	elif (type(dwell) == int) or (type(dwell) == float):
+		for freq in schedule:
+			yield (float(freq),float(dwell))
+		# end for
+
+	else:
+		# one dwell time per frequency
+		for (freq,d) in zip(schedule,dwell):
+			yield (float(freq),float(d))
+		# end for
+	# end else - elif - if
+# end steps
+
+
+# the pipelined writes and register shadow used by a sweep, enabled and
+# restored afterwards
+class _SweepContext:
+
+	def __init__(self,jds,depth):
+		self.jds=jds
+		self.depth=depth
+	# end constructor
+
+	def __enter__(self):
+		self.olddepth=self.jds.pipeline_getdepth()
+		self.oldshadow=self.jds.shadow_getenabled()
+
+		self.jds.shadow_enable()
+		self.jds.pipeline_start(self.depth)
+	# end enter
+
+	# the shadow is restored also when collecting the replies fails; an error
+	# collecting the replies does not hide an exception of the sweep
+	def __exit__(self,exc_type,exc,tb):
+		try:
+			if self.olddepth > 0:
+				self.jds.pipeline_start(self.olddepth)
+				self.jds.pipeline_flush()
+			else:
+				self.jds.pipeline_stop()
+			# end else - if
+		except Exception:
+			if exc_type == None:
+				raise
+			# end if
+		finally:
+			if self.oldshadow == False:
+				self.jds.shadow_disable()
+			# end if
+		# end try
+	# end exit
+
+# end class _SweepContext
+
+
+
+# sweep a channel along a list of frequencies
+#	schedule: iterable of (frequency, dwell) pairs, or of frequencies if
+#		"dwell" is given (a dwell time for all steps, or an iterable with one
+#		dwell time per frequency). Frequencies in Hz (see setfrequency for
+#		the multiplier), dwell times in seconds
+#	depth: number of writes waiting for an ":ok" (see pipeline_start)
+#	spin: time busy-waited before a step is due, in seconds
+#	progress: function called about once per second, with the number of
+#		steps done and the time elapsed
+# returns SweepReport
+def list_sweep(jds,channel,schedule,dwell=None,multiplier=0,depth=4,spin=0.002,progress=None):
+	if type(channel) != int: raise TypeError(channel)
+	if not (channel in (1,2)): raise ValueError(channel)
+	if type(depth) != int: raise TypeError(depth)
+	if (type(spin) != int) and (type(spin) != float): raise TypeError(spin)
+	if not (spin >= 0): raise ValueError(spin)
+
+	late=_Running()
+	interval=_Running()
+	overruns=0
+
+	with _SweepContext(jds,depth):
+		start=time.perf_counter()
+		due=start
+		lastsent=None
+		lastdwell=0.0
+		nextprogress=start+1
+
+		for (freq,d) in _steps(schedule,dwell):
+			if not (d >= 0): raise ValueError(d)
+
+			_waituntil(due,spin)
+
+			sent=time.perf_counter()
+			jds.setfrequency(channel,freq,multiplier)
+
+			# timing of this step
+			late.add(sent-due)
+			if (d > 0) and (sent-due > d):
+				overruns += 1
+			# end if
+
+			if lastsent != None:
+				interval.add(sent-lastsent-lastdwell)
+			# end if
+
+			lastsent=sent
+			lastdwell=d
+			due += d
+
+			if (progress != None) and (sent >= nextprogress):
+				progress(late.n,sent-start)
+				nextprogress=sent+1
+			# end if
+		# end for
+
+		# make sure the last step is done
+		jds.pipeline_flush()
+	# end with
+
+	elapsed=(lastsent-start) if lastsent != None else 0.0
+
+	return SweepReport(late.n,elapsed,(late.n-1)/elapsed if elapsed > 0 else 0.0,late.mean,late.std(),late.max,interval.std(),overruns)
+# end list sweep
+
+
+
+# step channel 1 through a list of frequencies, and measure every step on
+# EXT.IN (the device must be in "measure" mode)
+#	frequencies: iterable of frequencies (Hz, see setfrequency for the
+#		multiplier)
+#	tolerance: maximum difference between the frequency set and measured
+#		(Hz), None: do not check
+#	settle: extra time from setting a frequency to the start of the gate
+#		period that measures it, in seconds (e.g. for a device under test
+#		between channel 1 and EXT.IN)
+#	poll: time between two reads of the measured value, in seconds, default
+#		1/20 of the gate time
+# returns a generator of VerifiedStep, one per frequency. The pipelined writes
+# and the register shadow are restored when the generator ends or is closed.
+def verified_sweep(jds,frequencies,tolerance=None,multiplier=0,settle=0.0,poll=None,spin=0.002):
+	if (tolerance != None) and (type(tolerance) != int) and (type(tolerance) != float): raise TypeError(tolerance)
+	if (type(settle) != int) and (type(settle) != float): raise TypeError(settle)
+	if not (settle >= 0): raise ValueError(settle)
+	if (poll != None) and (type(poll) != int) and (type(poll) != float): raise TypeError(poll)
+	if (poll != None) and not (poll > 0): raise ValueError(poll)
+
+	if jds.getmode()[1] != "MEASURE":
+		raise WrongMode()
+	# end if
+
+	return _verified_sweep(jds,frequencies,tolerance,multiplier,settle,poll,spin)
+# end verified sweep
+
+
+def _verified_sweep(jds,frequencies,tolerance,multiplier,settle,poll,spin):
+	with _SweepContext(jds,16):
+		# result: M.FREQ (freq_f) or M.PERIOD (freq_p)
+		field=jds.measure_getmode()[0]
+
+		gate=jds.measure_getgate()
+		latency=jds.timeout_getlatency()
+		latency=latency[0] if latency != None else 0
+		if poll == None: poll=gate/20
+
+		for freq in frequencies:
+			freq=float(freq)
+
+			# pipelined: the ":ok" is collected by the first read
+			jds.setfrequency(1,freq,multiplier)
+
+			# poll once the write reached the device (and settled). The
+			# records of measure_stream are: the result before, the result
+			# of the gate period the write came in, and the result of the
+			# first gate period after the write
+			_waituntil(time.perf_counter()+latency+settle,spin)
+			samples=list(jds.measure_stream(("freq_f","freq_p"),poll,gate,3))
+			measured=samples[-1].values[field]
+
+			yield VerifiedStep(freq,measured,None if tolerance == None else abs(measured-freq) <= tolerance)
+		# end for
+	# end with
+# end verified sweep (generator)
@@ -0,0 +1,356 @@
+# jds6600synth.py
+# synthesis of arbitrary waveforms for a JDS6600 signal generator
+
+# published under MIT license. See file "LICENSE" for full license text
+
+# Builds waveforms for arb_setwave with numpy. Waveforms are first build as
+# floating point arrays of 2048 points (one period), which can be combined
+# (added, multiplied, windowed), and then quantised to 12 bits (0 to 4095):
+#
+#	wave = harmonics([1,0,1/3,0,1/5])		# first harmonics of a square wave
+#	wave = expression("sin(x)+0.2*sin(7*x+p)",p=0.5)
+#	wave = window(multitone([1,2,3,5,8,13]),"hann")
+#	(samples,stats) = quantise(wave,dither="tpdf")
+#	jds.arb_setwave(1,samples)
+#
+# Time/phase vectors, for one period of 2048 points:
+#	T: 0 to 1 (not included)
+#	X: 0 to 2*pi (not included)
+#
+# Note: needs numpy
+
+
+import collections
+import concurrent.futures
+
+import numpy
+
+
+# number of points and maximum value of an arbitrary waveform
+SAMPLES=2048
+MAXVALUE=4095
+
+T=numpy.arange(SAMPLES)/SAMPLES
+X=2*numpy.pi*T
+
+
+# statistics of quantise(): number of points clipped below and above the
+# range, and rms quantisation error (in steps, including dither, not
+# including clipping)
+QuantiseStats=collections.namedtuple("QuantiseStats",("clipped_low","clipped_high","error_rms"))
+
+
+
+###############
+# basic waves #
+###############
+
+# sum of harmonics: amplitudes[0] is the amplitude of the fundamental,
+# amplitudes[1] of the 2nd harmonic, ...
+# phases: phase of every harmonic (radians) (default: all 0)
+def harmonics(amplitudes,phases=None):
+	amplitudes=numpy.asarray(amplitudes,dtype=float)
+	if amplitudes.ndim != 1: raise ValueError(amplitudes)
+	if not (1 <= len(amplitudes) < SAMPLES//2): raise ValueError(amplitudes)
+
+	if phases is None:
+		phases=numpy.zeros(len(amplitudes))
+	else:
+		phases=numpy.asarray(phases,dtype=float)
+		if phases.shape != amplitudes.shape: raise ValueError(phases)
+	# end else - if
+
+	# the waveform is build from its spectrum
+	spectrum=numpy.zeros(SAMPLES//2+1,dtype=complex)
+	spectrum[1:len(amplitudes)+1]=amplitudes*numpy.exp(1j*(phases-numpy.pi/2))
+
+	return numpy.fft.irfft(spectrum,SAMPLES)*(SAMPLES/2)
+# end harmonics
+
+
+# names available in expression()
+_expression_names={name: getattr(numpy,name) for name in (
+	"sin","cos","tan","arcsin","arccos","arctan","arctan2","sinh","cosh","tanh",
+	"exp","log","log2","log10","sqrt","abs","sign","floor","ceil","round","mod",
+	"where","minimum","maximum","clip","pi","e")}
+
+# evaluate an expression for every point of the period, e.g.
+# "sin(x)", "where(t < 0.5, 1, -1)" or "exp(-t/tau)" (with tau=0.2)
+#	t: time, 0 to 1 (not included)
+#	x: phase, 0 to 2*pi (not included)
+#	params: other values used in the expression
+# note: the expression is evaluated as python code: do not evaluate
+# expressions from untrusted sources
+def expression(expr,**params):
+	if type(expr) != str: raise TypeError(expr)
+
+	names=dict(_expression_names)
+	names.update(params)
+	names["t"]=T
+	names["x"]=X
+
+	wave=eval(expr,{"__builtins__": {}},names)
+
+	# a constant expression gives a constant waveform
+	return numpy.broadcast_to(numpy.asarray(wave,dtype=float),(SAMPLES,)).copy()
+# end expression
+
+
+# window a waveform: "rect", "hann", "hamming", "blackman" or "tukey"
+# (tukey: alpha is the tapered part of the window)
+def window(wave,name="hann",alpha=0.5):
+	wave=_wave(wave)
+
+	if name == "rect":
+		w=numpy.ones(SAMPLES)
+	elif name == "hann":
+		w=0.5-0.5*numpy.cos(X)
+	elif name == "hamming":
+		w=0.54-0.46*numpy.cos(X)
+	elif name == "blackman":
+		w=0.42-0.5*numpy.cos(X)+0.08*numpy.cos(2*X)
+	elif name == "tukey":
+		if not (0 < alpha <= 1): raise ValueError(alpha)
+
+		# cosine tapers at both ends, flat in the middle
+		w=numpy.ones(SAMPLES)
+		edge=alpha/2
+		rise=T < edge
+		fall=T > 1-edge
+		w[rise]=0.5-0.5*numpy.cos(numpy.pi*T[rise]/edge)
+		w[fall]=0.5-0.5*numpy.cos(numpy.pi*(1-T[fall])/edge)
+	else:
+		errmsg="Unknown window: "+str(name)
+		raise ValueError(errmsg)
+	# end else - elif - ... - if
+
+	return wave*w
+# end window
+
+
+# piecewise waveform, from a list of segments (duration, start, end, shape)
+#	duration: relative length of the segment (all segments together are
+#		one period)
+#	start, end: value at the start and the end of the segment
+#	shape: "linear", "hold" (start value), "cos" (half cosine), "exp"
+#		(exponential, start and end must have the same sign)
+def segments(seglist):
+	seglist=list(seglist)
+	if not seglist: raise ValueError(seglist)
+
+	durations=numpy.array([s[0] for s in seglist],dtype=float)
+	if (durations <= 0).any(): raise ValueError(seglist)
+
+	# segment boundaries, in points
+	bounds=numpy.round(numpy.concatenate(([0],numpy.cumsum(durations)))/durations.sum()*SAMPLES).astype(int)
+
+	wave=numpy.empty(SAMPLES)
+	for ((duration,start,end,shape),first,last) in zip(seglist,bounds[:-1],bounds[1:]):
+		n=last-first
+		if n == 0:
+			continue
+		# end if
+
+		# position in the segment: 0 to 1 (not included)
+		p=numpy.arange(n)/n
+
+		if shape == "linear":
+			wave[first:last]=start+(end-start)*p
+		elif shape == "hold":
+			wave[first:last]=start
+		elif shape == "cos":
+			wave[first:last]=start+(end-start)*(0.5-0.5*numpy.cos(numpy.pi*p))
+		elif shape == "exp":
+			if not (start*end > 0): raise ValueError((start,end))
+			wave[first:last]=start*(end/start)**p
+		else:
+			errmsg="Unknown segment shape: "+str(shape)
+			raise ValueError(errmsg)
+		# end else - elif - ... - if
+	# end for
+
+	return wave
+# end segments
+
+
+
+##############
+# multi-tone #
+##############
+
+# crest factor of a waveform: peak value / rms value (around the average)
+def crestfactor(wave):
+	wave=_wave(wave)
+	wave=wave-wave.mean()
+
+	rms=numpy.sqrt((wave**2).mean())
+	return numpy.abs(wave).max()/rms if rms > 0 else float("inf")
+# end crest factor
+
+
+# sum of tones (harmonic numbers: 1 = one period per waveform)
+#	amplitudes: amplitude per tone (default: all 1)
+#	phases: phase per tone (radians), or:
+#		"schroeder": Schroeder phases, a low crest factor for a flat spectrum
+#		"optimise": Schroeder phases, improved by iterative clipping
+#			(minimising the crest factor)
+#		"random": random phases (seed)
+#		"zero": all phases 0 (the highest crest factor)
+#	iterations: number of iterations for "optimise"
+def multitone(tones,amplitudes=None,phases="schroeder",iterations=200,seed=None):
+	tones=numpy.asarray(tones)
+	if (tones.ndim != 1) or (len(tones) == 0): raise ValueError(tones)
+	if tones.dtype.kind not in "iu": raise TypeError(tones)
+	if (tones < 1).any() or (tones >= SAMPLES//2).any(): raise ValueError(tones)
+	if len(numpy.unique(tones)) != len(tones): raise ValueError(tones)
+
+	if amplitudes is None:
+		amplitudes=numpy.ones(len(tones))
+	else:
+		amplitudes=numpy.asarray(amplitudes,dtype=float)
+		if amplitudes.shape != tones.shape: raise ValueError(amplitudes)
+	# end else - if
+
+	k=numpy.arange(1,len(tones)+1)
+
+	if type(phases) != str:
+		phi=numpy.asarray(phases,dtype=float)
+		if phi.shape != tones.shape: raise ValueError(phases)
+	elif phases in ("schroeder","optimise"):
+		# Schroeder phases, taking the power of every tone into account
+		power=amplitudes**2/(amplitudes**2).sum()
+		phi=numpy.array([-2*numpy.pi*((k[i]-k[:i])*power[:i]).sum() for i in range(len(tones))])
+	elif phases == "random":
+		phi=numpy.random.default_rng(seed).uniform(0,2*numpy.pi,len(tones))
+	elif phases == "zero":
+		phi=numpy.zeros(len(tones))
+	else:
+		errmsg="Unknown phases: "+phases
+		raise ValueError(errmsg)
+	# end else - elif - ... - if
+
+	def synth(phi):
+		spectrum=numpy.zeros(SAMPLES//2+1,dtype=complex)
+		spectrum[tones]=amplitudes*numpy.exp(1j*(phi-numpy.pi/2))
+		return numpy.fft.irfft(spectrum,SAMPLES)*(SAMPLES/2)
+	# end synth
+
+	wave=synth(phi)
+
+	if phases == "optimise":
+		# iterative clipping: clip the peaks, and keep the phases of the tones
+		# of the clipped waveform (amplitudes unchanged)
+		best=(crestfactor(wave),wave)
+		for i in range(iterations):
+			limit=0.9*numpy.abs(wave).max()
+			spectrum=numpy.fft.rfft(numpy.clip(wave,-limit,limit))
+			phi=numpy.angle(spectrum[tones])+numpy.pi/2
+			wave=synth(phi)
+
+			cf=crestfactor(wave)
+			if cf < best[0]:
+				best=(cf,wave)
+			# end if
+		# end for
+
+		wave=best[1]
+	# end if
+
+	return wave
+# end multitone
+
+
+
+################
+# quantisation #
+################
+
+# check a waveform: 2048 points
+def _wave(wave):
+	wave=numpy.asarray(wave,dtype=float)
+	if wave.shape != (SAMPLES,): raise ValueError(wave.shape)
+
+	return wave
+# end wave
+
+
+# quantise a waveform to 12 bits (0 to 4095)
+#	span: (low, high): values mapped to 0 and 4095, values outside are
+#		clipped; None: the waveform is scaled to the full range
+#	dither: None, "rpdf" (rectangular, 1 step) or "tpdf" (triangular, 2 steps)
+# returns (numpy uint16 array, QuantiseStats)
+def quantise(wave,span=None,dither=None,seed=None):
+	wave=_wave(wave)
+
+	if span is None:
+		(low,high)=(wave.min(),wave.max())
+		if low == high:
+			# constant waveform: middle of the range
+			(low,high)=(low-1,high+1)
+		# end if
+	else:
+		(low,high)=span
+		if not (high > low): raise ValueError(span)
+	# end else - if
+
+	exact=(wave-low)*(MAXVALUE/(high-low))
+
+	if dither == None:
+		scaled=exact
+	elif dither == "rpdf":
+		scaled=exact+numpy.random.default_rng(seed).uniform(-0.5,0.5,SAMPLES)
+	elif dither == "tpdf":
+		rng=numpy.random.default_rng(seed)
+		scaled=exact+rng.uniform(-0.5,0.5,SAMPLES)+rng.uniform(-0.5,0.5,SAMPLES)
+	else:
+		errmsg="Unknown dither: "+str(dither)
+		raise ValueError(errmsg)
+	# end else - elif - elif - if
+
+	rounded=numpy.round(scaled)
+	stats=QuantiseStats(
+		int((rounded < 0).sum()),
+		int((rounded > MAXVALUE).sum()),
+		float(numpy.sqrt(((rounded-exact)**2).mean())))
+
+	return (numpy.clip(rounded,0,MAXVALUE).astype(numpy.uint16),stats)
+# end quantise
+
+
+
+#########
+# batch #
+#########
+
+# run one function of a batch, quantising floating point results
+def _batchrun(function):
+	wave=function()
+
+	if numpy.asarray(wave).dtype.kind == "f":
+		(wave,stats)=quantise(wave)
+	# end if
+
+	return numpy.asarray(wave,dtype=numpy.uint16)
+# end batchrun
+
+
+# generate a library of waveforms
+#	functions: dictionary name -> function without arguments returning a
+#		waveform (e.g. functools.partial(harmonics,[1,0.5])). Floating point
+#		waveforms are quantised to the full range.
+#	processes: number of processes (default: number of cpus), 1: no
+#		processes. Processes are only used for at least "minprocess"
+#		waveforms; the functions must be picklable (no lambdas).
+# returns a dictionary name -> numpy uint16 array
+def batch(functions,processes=None,minprocess=32):
+	names=list(functions)
+
+	if (processes == 1) or (len(names) < minprocess):
+		return {name: _batchrun(functions[name]) for name in names}
+	# end if
+
+	with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+		waves=executor.map(_batchrun,[functions[name] for name in names],chunksize=8)
+		return dict(zip(names,waves))
+	# end with
+# end batch
@@ -0,0 +1,77 @@
+# tests of apply_state(), against the simulator
+
+import copy
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),".."))
+
+from jds6600 import jds6600, WrongMode
+from jds6600sim import JDS6600Simulator
+
+
+@pytest.fixture
+def device():
+	with JDS6600Simulator() as sim:
+		j=jds6600(sim.port)
+
+		# record the write commands send
+		written=[]
+		write=j.ser.write
+		def spy(data):
+			if bytes(data[:2]) in (b":w",b":a"):
+				written.append(bytes(data))
+			# end if
+			return write(data)
+		# end spy
+		j.ser.write=spy
+
+		yield (sim,j,written)
+		j.ser.close()
+	# end with
+# end device
+
+
+@pytest.mark.parametrize("desired,exception",(
+	({"mode":"MEASURE","frequency1":1000,"amplitude1":99},ValueError),
+	({"mode":"SWEEP_CH1","frequency1":1000},WrongMode),
+	({"mode":"WAVE_CH2","action":"SWEEP"},WrongMode)))
+def test_rejected_state_writes_nothing(device,desired,exception):
+	(sim,j,written)=device
+	regs=copy.deepcopy(sim.regs)
+
+	with pytest.raises(exception):
+		j.apply_state(desired)
+	# end with
+
+	assert written == []
+	assert sim.regs == regs
+# end test rejected state writes nothing
+
+
+def test_apply_state_writes_differences(device):
+	(sim,j,written)=device
+
+	report=j.apply_state({"mode":"WAVE_CH1","frequency1":1234.5,"amplitude1":5.0})
+	assert report == [("frequency1",jds6600.FREQUENCY1,"123450,0")]
+
+	report=j.apply_state({"mode":"SWEEP_CH1","sweep_time":2})
+	assert [r[0] for r in report] == ["mode","sweep_time"]
+	assert j.getmode()[1] == "SWEEP_CH1"
+# end test apply state writes differences
+
+
+def test_apply_state_restarts_action_after_mode_change(device):
+	(sim,j,written)=device
+
+	j.setmode("SWEEP_CH1")
+	j.sweep_start()
+
+	# the mode change stops the sweep: it must be started again
+	report=j.apply_state({"mode":"SWEEP_CH2","action":"SWEEP"})
+	assert [r[0] for r in report] == ["mode","action"]
+	assert j.getmode()[1] == "SWEEP_CH2"
+	assert sim.regs[jds6600.ACTION] == [0,1,0,0]
+# end test apply state restarts action after mode change
@@ -0,0 +1,28 @@
+# tests of measure_stream(), against the simulator
+
+import os
+import sys
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),".."))
+
+from jds6600 import jds6600
+from jds6600sim import JDS6600Simulator
+
+
+def test_measure_stream_keeps_equal_gate_results():
+	# a constant signal: every gate period gives the same result, which is
+	# a new record every gate time
+	with JDS6600Simulator() as sim:
+		j=jds6600(sim.port)
+		j.setmode("MEASURE")
+		j.measure_setgate(0.05)
+
+		times=[sample.time for sample in j.measure_stream(("freq_f",),count=21)]
+		gaps=[b-a for (a,b) in zip(times,times[1:])]
+
+		assert max(gaps) < 0.075
+		assert abs((times[-1]-times[0])/20-0.05) < 0.005
+
+		j.ser.close()
+	# end with
+# end test measure stream keeps equal gate results
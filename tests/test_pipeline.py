@@ -0,0 +1,70 @@
+# tests of the pipelined write mode, against the simulator
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),".."))
+
+from jds6600 import jds6600, PipelineError
+from jds6600sim import JDS6600Simulator
+
+
+@pytest.fixture
+def device():
+	# every reply is dropped: all pipelined writes fail
+	with JDS6600Simulator(drop=1) as sim:
+		j=jds6600(sim.port)
+		j.timeout_set(0.05)
+		yield j
+		j.ser.close()
+	# end with
+# end device
+
+
+def test_pipeline_error_on_normal_exit(device):
+	with pytest.raises(PipelineError):
+		with device.pipeline():
+			device.setamplitude(1,1.0)
+		# end with
+	# end with
+
+	assert device.pipeline_getdepth() == 0
+# end test pipeline error on normal exit
+
+
+def test_pipeline_keeps_exception_of_block(device):
+	with pytest.raises(KeyError):
+		with device.pipeline():
+			device.setamplitude(1,1.0)
+			raise KeyError("block")
+		# end with
+	# end with
+
+	assert device.pipeline_getdepth() == 0
+# end test pipeline keeps exception of block
+
+
+def test_pipeline_waits_for_large_writes():
+	# the ":ok" of a pipelined arbitrary waveform comes after the transfer
+	# of about 10 KB of command, and of the commands before it
+	wave=[(i*2)%4096 for i in range(2048)]
+
+	with JDS6600Simulator(baudrate=115200) as sim:
+		j=jds6600(sim.port)
+		# learn the latency of the link: short timeouts from here
+		j.getmode()
+
+		with j.pipeline():
+			j.arb_setwave(1,wave)
+			j.arb_setwave(2,wave)
+		# end with
+
+		j.setfrequency(1,1234)
+		assert j.getfrequency(1) == 1234
+		assert j.arb_getwave(2) == wave
+
+		j.ser.close()
+	# end with
+# end test pipeline waits for large writes
@@ -0,0 +1,28 @@
+# tests of the register shadow, against the simulator
+
+import os
+import sys
+
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),".."))
+
+from jds6600 import jds6600
+from jds6600sim import JDS6600Simulator
+
+
+def test_shadow_skips_action_registers_and_debug_writes():
+	with JDS6600Simulator() as sim:
+		j=jds6600(sim.port)
+		j.shadow_enable()
+
+		# a counter reset is an action, not a stored value
+		j.counter_reset()
+		assert jds6600.COUNTER_RESETCOUNTER not in j._jds6600__shadow
+
+		# a write bypassing the set-functions is read again from the device
+		assert j.getamplitude(1) == sim.regs[jds6600.AMPLITUDE1][0]/1000
+		j.DEBUG_writeregister(jds6600.AMPLITUDE1,1234)
+		assert j.getamplitude(1) == 1.234
+
+		j.ser.close()
+	# end with
+# end test shadow skips action registers and debug writes